@@ -0,0 +1,208 @@
+"""Score how well each annotation's beat grid lines up with its audio, to flag bad red lines.
+
+For every song an onset-strength envelope (madmom superflux, FPS frames/s) is
+computed once and standardized, so a random position scores 0 on average.
+The beat grid (the <song>_beats_metered.txt written from
+extract_metered_beats_correct) is then cross-correlated with it for every
+candidate offset in +/- MAX_SHIFT at once: a (shifts x beats) gather of
+envelope values. Columns written per song:
+
+    score                 mean envelope at the annotated beats (in standard deviations)
+    offset_correction_ms  shift that maximizes the score; add it to the red-line offsets
+    best_score            score at that shift
+    drift_ms              best shift of the last SEGMENTS-th of the song minus the first;
+                          a steady drift means a wrong BPM rather than a wrong offset
+    flagged               worth checking by hand (see needs_review)
+"""
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import instrumentation
+from audio_cache import DEFAULT_MAX_BYTES, SAMPLE_RATE, AudioCache
+from instrumentation import count, instrumented, stage
+from madmom_evaluation import iter_labels
+from table_io import ALIGNMENT_TYPES, TableWriter
+
+FPS = 100
+SMOOTHING = 0.015  # Gaussian sigma (s), so a beat one frame off still scores
+ENVELOPE_LATENCY = 0.01  # superflux peaks ~10 ms before a sharp attack (measured on click tracks)
+MAX_SHIFT = 0.1  # seconds searched either side of the annotated grid
+SEGMENTS = 4
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.ogg')
+
+# needs_review thresholds
+FLAG_MIN_SCORE = 0.5  # grid barely above a random one
+FLAG_OFFSET_MS = 20.0
+FLAG_GAIN = 0.5  # best_score - score before an offset suggestion counts
+FLAG_DRIFT_MS = 30.0
+
+ALIGNMENT_COLUMNS = ("song_id", "num_beats", "score", "offset_correction_ms", "best_score", "drift_ms", "flagged")
+
+_onset_processor = None
+
+
+def onset_envelope(audio_path, fps=FPS, cache=None):
+    """Standardized, lightly smoothed superflux onset strength of an audio file, one value per frame.
+
+    With an AudioCache the raw envelope is computed once per track and kept there.
+    """
+    global _onset_processor
+    if _onset_processor is None:
+        from madmom.audio.filters import LogarithmicFilterbank
+        from madmom.features.onsets import SpectralOnsetProcessor
+        # explicit sample rate/channels: with the defaults a cached Signal would be "resampled" through ffmpeg
+        _onset_processor = SpectralOnsetProcessor(onset_method='superflux', fps=fps, filterbank=LogarithmicFilterbank,
+                                                  num_bands=24, log=np.log10, sample_rate=SAMPLE_RATE,
+                                                  num_channels=1)
+    if cache is not None:
+        envelope = cache.feature(audio_path, f"superflux{fps}", _onset_processor)
+    else:
+        envelope = _onset_processor(audio_path)
+    envelope = np.asarray(envelope, dtype=np.float64)
+    radius = int(np.ceil(3 * SMOOTHING * fps))
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / (SMOOTHING * fps)) ** 2)
+    envelope = np.convolve(envelope, kernel / kernel.sum(), mode='same')
+    std = envelope.std()
+    return (envelope - envelope.mean()) / std if std > 0 else np.zeros_like(envelope)
+
+
+def alignment_scores(envelope, beat_times, fps=FPS, max_shift=MAX_SHIFT, segments=SEGMENTS,
+                     latency=ENVELOPE_LATENCY):
+    """Cross-correlate a beat grid with an onset envelope over every shift in +/- max_shift."""
+    max_lag = int(round(max_shift * fps))
+    shifts = np.arange(-max_lag, max_lag + 1)
+    frames = np.rint((np.asarray(beat_times, dtype=np.float64) - latency) * fps).astype(np.int64)
+    index = frames[None, :] + shifts[:, None]  # (shifts, beats)
+    valid = (index >= 0) & (index < len(envelope))
+    values = np.where(valid, envelope[np.clip(index, 0, max(len(envelope) - 1, 0))], 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        curve = values.sum(axis=1) / valid.sum(axis=1)
+        starts = np.linspace(0, len(frames), segments, endpoint=False).astype(np.int64)
+        starts = np.unique(starts)
+        segment_curves = np.add.reduceat(values, starts, axis=1) / np.add.reduceat(valid, starts, axis=1)
+    curve = np.nan_to_num(curve, nan=-np.inf)
+    segment_curves = np.nan_to_num(segment_curves, nan=-np.inf)
+
+    best = int(np.argmax(curve))
+    segment_best = shifts[np.argmax(segment_curves, axis=0)]
+    return {
+        "num_beats": len(frames),
+        "score": float(curve[max_lag]),
+        "offset_correction_ms": 1000.0 * _refine_peak(curve, best, shifts) / fps,
+        "best_score": float(curve[best]),
+        "drift_ms": 1000.0 * float(segment_best[-1] - segment_best[0]) / fps,
+    }
+
+
+def _refine_peak(curve, best, shifts):
+    """Sub-frame peak position by fitting a parabola through the best shift and its neighbours."""
+    if 0 < best < len(curve) - 1 and np.isfinite(curve[best - 1:best + 2]).all():
+        left, center, right = curve[best - 1:best + 2]
+        denominator = left - 2 * center + right
+        if denominator < 0:
+            return float(shifts[best]) + 0.5 * (left - right) / denominator
+    return float(shifts[best])
+
+
+def needs_review(row):
+    """Low score, a clearly better nearby offset, or drift across the song."""
+    suggests_offset = abs(row["offset_correction_ms"]) >= FLAG_OFFSET_MS \
+        and row["best_score"] - row["score"] >= FLAG_GAIN
+    return bool(row["score"] < FLAG_MIN_SCORE or suggests_offset or abs(row["drift_ms"]) >= FLAG_DRIFT_MS)
+
+
+def find_audio(audio_folder, song_id):
+    for extension in AUDIO_EXTENSIONS:
+        path = os.path.join(audio_folder, song_id + extension)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+# ===== Corpus runner =====
+
+_worker_instrumented = False
+_audio_cache = None
+
+
+def _init_worker(instrumentation_options=None, cache_args=None):
+    global _worker_instrumented, _audio_cache
+    if instrumentation_options is not None:
+        instrumentation.activate(instrumentation_options)
+        _worker_instrumented = True
+    _audio_cache = AudioCache(*cache_args) if cache_args else None
+
+
+def _score_song(task):
+    """Worker: (song_id, audio_path, beat_times) -> (row or None, error or None, instrumentation)"""
+    song_id, audio_path, beat_times = task
+    row = error = None
+    with instrumentation.track_file(song_id):
+        try:
+            with stage("envelope"):
+                envelope = onset_envelope(audio_path, cache=_audio_cache)
+            with stage("score"):
+                row = {"song_id": song_id, **alignment_scores(envelope, beat_times)}
+                row["flagged"] = needs_review(row)
+        except Exception as e:
+            error = str(e)
+            count("unreadable_audio")
+    return row, error, instrumentation.current().drain() if _worker_instrumented else None
+
+
+def _iter_scores(tasks, workers, run, cache_args):
+    if workers <= 1:
+        _init_worker(cache_args=cache_args)
+        yield from map(_score_song, tasks)
+        return
+    initargs = (run.options if run is not None else None, cache_args)
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as pool:
+        yield from pool.map(_score_song, tasks, chunksize=4)
+
+
+def score_folder(audio_folder, label_folder, output_path, workers=1, label_store=None, stats_path=None,
+                 audio_cache=None, audio_cache_max_bytes=DEFAULT_MAX_BYTES):
+    """Alignment score for every annotated song whose <song_id>.mp3 (or .wav/.flac/.ogg) is in `audio_folder`.
+
+    Labels come from `label_store` (an annotation store or a zip) instead of
+    `label_folder` when given, as in madmom_evaluation. `output_path` is a .csv
+    or .parquet table with ALIGNMENT_COLUMNS; returns the number of flagged songs.
+    `audio_cache` is an audio_cache folder (shared with self_track_madmom) for
+    the decoded audio and onset envelopes.
+    """
+    with instrumented("alignment", stats_path):
+        run = instrumentation.current()
+        tasks = []
+        for song_id, times, _ in iter_labels(label_folder, label_store):
+            if len(times) < SEGMENTS:
+                count("too_few_beats")
+                continue
+            audio_path = find_audio(audio_folder, song_id)
+            if audio_path is None:
+                count("missing_audio")
+                continue
+            tasks.append((song_id, audio_path, np.asarray(times, dtype=np.float64)))
+
+        cache_args = (audio_cache, audio_cache_max_bytes) if audio_cache else None
+        scored = flagged = 0
+        with TableWriter(output_path, ALIGNMENT_COLUMNS, ALIGNMENT_TYPES) as writer:
+            for (song_id, _, _), (row, error, worker_stats) in zip(tasks, _iter_scores(tasks, workers, run, cache_args)):
+                if worker_stats is not None and run is not None:
+                    run.merge(worker_stats)
+                if error is not None:
+                    print(f"❌ Failed to score {song_id}: {error}")
+                    continue
+                scored += 1
+                flagged += row["flagged"]
+                writer.add(row)
+        print(f"🎯 Scored {scored}/{len(tasks)} songs, {flagged} flagged for review. Saved to {output_path}")
+        return flagged
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    score_folder("./new_audio", "./metered_beats", "./alignment_scores.csv", workers=os.cpu_count() or 1)
@@ -1,103 +1,138 @@
 import os
-import zipfile
-import tempfile
-import shutil
+import sys
 import json
+from collections import deque
 
-def extract_uninherited_timing_points(osu_lines):
-    timing_points = []
-    reading = False
-    for line in osu_lines:
-        line = line.strip()
-        if line == "[TimingPoints]":
-            reading = True
-            continue
-        if reading:
-            if line.startswith("["):
-                break
-            parts = line.split(",")
-            if len(parts) >= 7:
-                try:
-                    time = float(parts[0])
-                    beat_length = float(parts[1])
-                    meter = int(parts[2])
-                    uninherited = int(parts[6]) == 1
-                    if uninherited:
-                        timing_points.append({
-                            "time": time,
-                            "beat_length": beat_length,
-                            "meter": meter
-                        })
-                except ValueError:
-                    continue
-    return timing_points
-
-def get_audio_filename(osu_lines):
-    in_general = False
-    for line in osu_lines:
-        line = line.strip()
-        if line == '[General]':
-            in_general = True
-            continue
-        if in_general:
-            if line.startswith('['):
-                break
-            if line.startswith('AudioFilename:'):
-                return line.split(':', 1)[1].strip()
-    return None
-
-def process_osz(osz_path, audio_output_dir, json_output_dir):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import instrumentation
+from build_cache import BuildCache, copy_audio_dedup
+from instrumentation import count, instrumented, stage
+from io_pool import IOPool, copy_audio_from_osz, finished
+from osz_archive import OszArchive
+
+def extract_uninherited_timing_points(timing_points):
+    red = timing_points[timing_points["uninherited"]]
+    return [
+        {"time": time, "beat_length": beat_length, "meter": meter}
+        for time, beat_length, meter in zip(red["time"].tolist(), red["beat_length"].tolist(), red["meter"].tolist())
+    ]
+
+def write_timing_json(json_dest, uninherited_points):
+    with stage("write"), open(json_dest, 'w') as f:
+        json.dump(uninherited_points, f, indent=2)
+
+def process_osz(osz_path, audio_output_dir, json_output_dir, known_audio=None, io=None):
+    """Write audio + uninherited-timing JSON; returns (outputs, (md5, crc, size)) or None on failure.
+
+    With an `io` pool (io_pool.IOPool) both writes are queued instead and the
+    return value is (outputs, audio_future, jobs).
+    """
     song_name = os.path.splitext(os.path.basename(osz_path))[0]
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        with zipfile.ZipFile(osz_path, 'r') as zip_ref:
-            zip_ref.extractall(tmpdir)
+    with stage("unzip"):
+        archive = OszArchive(osz_path)
+        osu_files = archive.osu_names()
 
-        osu_files = [f for f in os.listdir(tmpdir) if f.endswith(".osu")]
+    with archive:
         if not osu_files:
             print(f"❌ No .osu file in {song_name}")
+            count("no_osu")
             return
 
-        osu_path = os.path.join(tmpdir, osu_files[0])
-        with open(osu_path, 'r', encoding='utf-8') as f:
-            osu_lines = f.readlines()
+        with stage("parse"):
+            beatmap = archive.parse_osu(osu_files[0])
 
-        audio_filename = get_audio_filename(osu_lines)
+        audio_filename = beatmap["general"].get("AudioFilename")
         if not audio_filename:
             print(f"❌ Audio filename not found in {song_name}")
+            count("missing_audio_filename")
             return
 
-        audio_path = os.path.join(tmpdir, audio_filename)
-        if not os.path.isfile(audio_path):
+        audio_member = archive.find_member(audio_filename)
+        if audio_member is None:
             print(f"❌ MP3 file '{audio_filename}' missing in {song_name}")
+            count("missing_mp3")
             return
 
         # Copy audio
         os.makedirs(audio_output_dir, exist_ok=True)
         audio_dest = os.path.join(audio_output_dir, f"{song_name}.mp3")
-        shutil.copy(audio_path, audio_dest)
+        if io is not None:
+            audio = io.submit(copy_audio_from_osz, osz_path, audio_member, audio_dest, known_audio)
+        else:
+            with stage("copy"):
+                audio = copy_audio_dedup(archive, audio_member, audio_dest, known_audio)
 
         # Extract and save uninherited timing points to JSON
-        uninherited_points = extract_uninherited_timing_points(osu_lines)
+        uninherited_points = extract_uninherited_timing_points(beatmap["timing_points"])
         os.makedirs(json_output_dir, exist_ok=True)
-        with open(os.path.join(json_output_dir, f"{song_name}_uninherited.json"), 'w') as f:
-            json.dump(uninherited_points, f, indent=2)
+        json_dest = os.path.join(json_output_dir, f"{song_name}_uninherited.json")
+        if io is not None:
+            jobs = [audio, io.submit(write_timing_json, json_dest, uninherited_points)]
+            return [audio_dest, json_dest], audio, jobs
+        write_timing_json(json_dest, uninherited_points)
 
         print(f"✅ Processed {song_name}")
+        return [audio_dest, json_dest], audio
+
+def process_all_osz_in_folder(folder_path, cache_path=None, io_threads=0, stats_path=None):
+    """Timing JSON + audio for every .osz; `stats_path` writes a JSON run summary (see instrumentation)"""
+    with instrumented("timing_json", stats_path):
+        audio_dir = os.path.join(folder_path, "extracted_audio")
+        json_dir = os.path.join(folder_path, "uninherited_timing_json")
+
+        os.makedirs(audio_dir, exist_ok=True)
+        os.makedirs(json_dir, exist_ok=True)
 
-def process_all_osz_in_folder(folder_path):
-    audio_dir = os.path.join(folder_path, "extracted_audio")
-    json_dir = os.path.join(folder_path, "uninherited_timing_json")
+        # Optional build_cache manifest: skip unchanged archives, hardlink duplicate audio
+        cache = BuildCache(cache_path) if cache_path else None
+        known_audio = cache.known_audio() if cache else None
 
-    os.makedirs(audio_dir, exist_ok=True)
-    os.makedirs(json_dir, exist_ok=True)
+        # Optional background writes: copies and JSON dumps overlap with parsing the next archive
+        io = IOPool(io_threads) if io_threads > 0 else None
+        pending = deque()
+
+        def record(osz_path, outputs, audio):
+            if cache:
+                md5, crc, size = audio
+                cache.record_audio(md5, crc, size, outputs[0])
+                known_audio.setdefault((crc, size), (md5, os.path.abspath(outputs[0])))
+                cache.record("timing_json", osz_path, outputs, audio_md5=md5)
+
+        def drain(wait=False):
+            for (osz_path, outputs, audio), error in finished(pending, wait):
+                song_name = os.path.splitext(os.path.basename(osz_path))[0]
+                if error is not None:
+                    print(f"⚠️ Error writing {song_name}: {error}")
+                    count("write_error")
+                    continue
+                print(f"✅ Processed {song_name}")
+                record(osz_path, outputs, audio.result())
+
+        for file in os.listdir(folder_path):
+            if file.endswith('.osz'):
+                osz_path = os.path.join(folder_path, file)
+                if cache and cache.lookup("timing_json", osz_path):
+                    continue
+                try:
+                    with instrumentation.track_file(file):
+                        processed = process_osz(osz_path, audio_dir, json_dir, known_audio, io)
+                except Exception as e:
+                    print(f"⚠️ Error processing {file}: {e}")
+                    count("error")
+                    continue
+                if processed and io is not None:
+                    outputs, audio, jobs = processed
+                    pending.append(((osz_path, outputs, audio), jobs))
+                    drain()
+                elif processed:
+                    record(osz_path, *processed)
 
-    for file in os.listdir(folder_path):
-        if file.endswith('.osz'):
-            try:
-                process_osz(os.path.join(folder_path, file), audio_dir, json_dir)
-            except Exception as e:
-                print(f"⚠️ Error processing {file}: {e}")
+        if io is not None:
+            drain(wait=True)
+            io.close()
+        if cache:
+            cache.close()
 
 # === MAIN ===
 if __name__ == "__main__":
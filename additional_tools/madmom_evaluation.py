@@ -1,75 +1,261 @@
 import os
+import sys
+import time
 import numpy as np
-import pandas as pd
-from madmom.evaluation.beats import BeatEvaluation, BeatMeanEvaluation
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_selected_metrics(eval_obj):
-    return {
-        "fmeasure": eval_obj.fmeasure,
-        "cmlt": eval_obj.cmlt,
-        "amlt": eval_obj.amlt,
-    }
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from annotation_store import open_annotations
+from instrumentation import instrumented, stage
+from multi_difficulty import nearest_distance
+
+# BeatEvaluation defaults; only the metrics we report are computed
+FMEASURE_WINDOW = 0.07
+CONTINUITY_TEMPO_TOLERANCE = 0.175
+CONTINUITY_PHASE_TOLERANCE = 0.175
+METRICS = ("fmeasure", "cmlt", "amlt")
+
+def evaluate_beats(detections, annotations):
+    """F-measure, CMLt and AMLt, identical to madmom's BeatEvaluation with default settings"""
+    from madmom.evaluation.beats import continuity  # deferred: madmom is slow to import
+    from madmom.evaluation.onsets import OnsetEvaluation
+    detections = np.sort(np.asarray(detections, dtype=float).reshape(-1))
+    annotations = np.sort(np.asarray(annotations, dtype=float).reshape(-1))
+    fmeasure = OnsetEvaluation(detections, annotations, window=FMEASURE_WINDOW).fmeasure
+    _, cmlt, _, amlt = continuity(detections, annotations,
+                                  CONTINUITY_TEMPO_TOLERANCE, CONTINUITY_PHASE_TOLERANCE,
+                                  offbeat=True, double=True, triple=True)
+    return fmeasure, cmlt, amlt
+
+# ===== Metric levels =====
+# The annotated grid plus the variants AMLt accepts. A tracker running at the
+# wrong metric level scores best against one of them instead of the annotation.
+METRIC_LEVELS = ("annotated", "double", "half", "offbeat", "triple", "third")
+MIN_LEVEL_FMEASURE = 0.5  # songs below this against every variant are labelled "none"
+
+def metric_variants(beats, positions):
+    """(level, times) for the annotated grid and its variants; half and third give one entry per phase.
+
+    triple/third are only built when the annotation has a bar length divisible by 3.
+    """
+    midpoints = (beats[:-1] + beats[1:]) / 2
+    variants = [("annotated", beats), ("double", np.sort(np.concatenate([beats, midpoints]))),
+                ("half", beats[0::2]), ("half", beats[1::2]), ("offbeat", midpoints)]
+    meters = positions[:-1][positions[1:] == 1]  # position of the last beat of each bar
+    if not len(meters) and len(positions):
+        meters = positions.max(keepdims=True)
+    if np.any(meters % 3 == 0):
+        intervals = np.diff(beats)
+        thirds = np.concatenate([beats[:-1] + intervals / 3, beats[:-1] + 2 * intervals / 3])
+        variants.append(("triple", np.sort(np.concatenate([beats, thirds]))))
+        variants += [("third", beats[phase::3]) for phase in range(3)]
+    return variants
+
+def metric_level_fmeasures(detections, beats, positions, window=FMEASURE_WINDOW):
+    """Beat F-measure against every METRIC_LEVELS variant (best phase; NaN if not built) in one pass.
+
+    The variants are laid end to end, each shifted past the previous one, so a
+    single searchsorted matches every detection against all of them. Matching is
+    nearest-neighbour (as multi_difficulty.beat_agreement), which is enough to
+    rank the levels; the reported F-measure stays madmom's.
+    """
+    variants = metric_variants(beats, positions)
+    lengths = np.array([len(times) for _, times in variants])
+    end = max(beats[-1] if len(beats) else 0.0, detections[-1] if len(detections) else 0.0)
+    offsets = (end + 2 * window + 1.0) * np.arange(len(variants))
+    stacked = np.concatenate([times + offset for (_, times), offset in zip(variants, offsets)])
+    owner = np.repeat(np.arange(len(variants)), lengths)
+
+    if len(detections) and len(stacked):
+        recall_hits = np.bincount(owner, weights=nearest_distance(detections, stacked - offsets[owner]) <= window,
+                                  minlength=len(variants))
+        queries = (detections[None, :] + offsets[:, None]).ravel()
+        precision_hits = (nearest_distance(stacked, queries) <= window).reshape(len(variants), -1).sum(axis=1)
+    else:
+        recall_hits = precision_hits = np.zeros(len(variants))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        precision = precision_hits / max(len(detections), 1)
+        recall = recall_hits / lengths
+        fmeasure = np.nan_to_num(2 * precision * recall / (precision + recall))
+
+    scores = np.full(len(METRIC_LEVELS), np.nan)
+    for (level, _), value in zip(variants, fmeasure):
+        index = METRIC_LEVELS.index(level)
+        scores[index] = value if np.isnan(scores[index]) else max(scores[index], value)
+    return scores
+
+def metric_level_labels(level_scores):
+    """Best-matching level per row of metric_level_fmeasures results; ties go to the earlier level."""
+    best = np.nanargmax(level_scores, axis=1)
+    labels = np.array(METRIC_LEVELS, dtype=object)[best]
+    labels[level_scores[np.arange(len(best)), best] < MIN_LEVEL_FMEASURE] = "none"
+    return labels
 
-def evaluate_folder_f_cmlt_amlt(madmom_folder, label_folder, output_csv):
-    beat_evals = []
-    downbeat_evals = []
-    results = []
+def analysis_paths(output_path):
+    """Extreme-case and metric-level table paths next to a results table (single_f_cmlt_amlt.csv →
+    single_extreme.csv, single_metric_levels.csv)"""
+    stem, extension = os.path.splitext(output_path)
+    if stem.endswith("_f_cmlt_amlt"):
+        stem = stem[:-len("_f_cmlt_amlt")]
+    return f"{stem}_extreme{extension}", f"{stem}_metric_levels{extension}"
 
+# ===== Packed (offset-indexed ragged) storage =====
+def pack_ragged(arrays, dtype=float):
+    """Concatenate variable-length arrays into (values, offsets); item i is values[offsets[i]:offsets[i + 1]]"""
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in arrays], out=offsets[1:])
+    values = np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.zeros(0, dtype=dtype)
+    return values, offsets
+
+def ragged_slice(values, offsets, start, stop):
+    """Sub-range [start, stop) of a packed array, re-based so it packs on its own"""
+    return values[offsets[start]:offsets[stop]], offsets[start:stop + 1] - offsets[start]
+
+def _read_floats(path):
+    with open(path, 'r') as f:
+        return np.array(f.read().split(), dtype=float)
+
+def iter_labels(label_folder, label_store):
+    """(song_id, times, positions) from an annotation store, a zip such as
+    osu2beat2025_metered_beats.zip, or a folder of _beats_metered.txt files"""
+    if label_store is not None:
+        store = open_annotations(label_store)
+        for song_id in store:
+            beats = store[song_id]
+            yield song_id, beats["time"], beats["position"]
+        return
     for file in os.listdir(label_folder):
-        if not file.endswith("_beats_metered.txt"):
-            continue
+        if file.endswith("_beats_metered.txt"):
+            gt = _read_floats(os.path.join(label_folder, file)).reshape(-1, 2)
+            yield file.replace("_beats_metered.txt", ""), gt[:, 0], gt[:, 1]
+
+def load_evaluation_set(madmom_folder, label_folder, label_store=None):
+    """Load every annotation/detection pair once into packed arrays"""
+    song_ids, gt_times, gt_meters, beats, downbeats = [], [], [], [], []
 
-        song_id = file.replace("_beats_metered.txt", "")
-        label_path = os.path.join(label_folder, file)
+    for song_id, times, positions in iter_labels(label_folder, label_store):
         beat_path = os.path.join(madmom_folder, f"{song_id}_beats.txt")
         downbeat_path = os.path.join(madmom_folder, f"{song_id}_downbeats.txt")
 
         if not os.path.exists(beat_path) or not os.path.exists(downbeat_path):
             continue
 
-        # Load detections
-        detected_beats = np.loadtxt(beat_path)
-        detected_downbeats = np.loadtxt(downbeat_path)
+        song_ids.append(song_id)
+        gt_times.append(times)
+        gt_meters.append(positions)
+        beats.append(_read_floats(beat_path))
+        downbeats.append(_read_floats(downbeat_path))
+
+    return {
+        "song_ids": song_ids,
+        "gt_times": pack_ragged(gt_times),
+        "gt_meters": pack_ragged(gt_meters, dtype=np.int8),
+        "beats": pack_ragged(beats),
+        "downbeats": pack_ragged(downbeats),
+    }
+
+def _evaluate_chunk(chunk):
+    """Worker: beat and downbeat metrics for every song in a packed chunk"""
+    gt_times, gt_offsets = chunk["gt_times"]
+    gt_meters, _ = chunk["gt_meters"]
+    beats, beat_offsets = chunk["beats"]
+    downbeats, downbeat_offsets = chunk["downbeats"]
 
-        # Load ground truth
-        gt_data = pd.read_csv(label_path, sep="\t", header=None, names=["time", "meter"])
-        gt_beats = gt_data["time"].values
-        gt_downbeats = gt_data[gt_data["meter"] == 1]["time"].values
+    rows = []
+    for i in range(len(gt_offsets) - 1):
+        gt = slice(gt_offsets[i], gt_offsets[i + 1])
+        gt_beats = gt_times[gt]
+        gt_downbeats = gt_beats[gt_meters[gt] == 1]
+        song_beats = beats[beat_offsets[i]:beat_offsets[i + 1]]
+        row = evaluate_beats(song_beats, gt_beats) \
+            + evaluate_beats(downbeats[downbeat_offsets[i]:downbeat_offsets[i + 1]], gt_downbeats)
+        if chunk["analysis"]:
+            row += tuple(metric_level_fmeasures(np.sort(song_beats), np.sort(gt_beats), gt_meters[gt]))
+        rows.append(row)
+    return rows
 
-        # Evaluate
-        beat_eval = BeatEvaluation(detected_beats, gt_beats)
-        downbeat_eval = BeatEvaluation(detected_downbeats, gt_downbeats, downbeats=True)
+def _chunks(data, chunk_size, analysis=False):
+    for start in range(0, len(data["song_ids"]), chunk_size):
+        stop = min(start + chunk_size, len(data["song_ids"]))
+        chunk = {key: ragged_slice(*data[key], start, stop) for key in ("gt_times", "gt_meters", "beats", "downbeats")}
+        chunk["analysis"] = analysis
+        yield chunk
 
-        beat_evals.append(beat_eval)
-        downbeat_evals.append(downbeat_eval)
+def _save(df, path):
+    # A .parquet path keeps the scores as float64 columns; needs pyarrow
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
 
-        beat_metrics = extract_selected_metrics(beat_eval)
-        downbeat_metrics = extract_selected_metrics(downbeat_eval)
+def evaluate_folder_f_cmlt_amlt(madmom_folder, label_folder, output_csv, workers=1, chunk_size=32, label_store=None,
+                               stats_path=None, analysis=True):
+    """Per-song and mean F-measure/CMLt/AMLt.
 
-        results.append({
-            "song_id": song_id,
-            **{f"beat_{k}": v for k, v in beat_metrics.items()},
-            **{f"downbeat_{k}": v for k, v in downbeat_metrics.items()},
-        })
+    Labels come from `label_store` (an annotation store or a zip of
+    _beats_metered.txt files) instead of `label_folder` when given.
+    `output_csv` may also be a .parquet path (see table_io.read_table).
+    `stats_path` writes load/evaluate/write timings there (see instrumentation).
+    With `analysis`, the extreme-case table (songs with any metric exactly 0 or
+    1, as tables/*_extreme.csv) and the metric-level table (beat F-measure
+    against each METRIC_LEVELS variant and the best-matching level) are written
+    next to `output_csv` (see analysis_paths).
+    """
+    with instrumented("evaluation", stats_path):
+        _evaluate_folder(madmom_folder, label_folder, output_csv, workers, chunk_size, label_store, analysis)
 
-    # Mean evaluations
-    beat_mean = BeatMeanEvaluation(beat_evals)
-    downbeat_mean = BeatMeanEvaluation(downbeat_evals)
+def _evaluate_folder(madmom_folder, label_folder, output_csv, workers, chunk_size, label_store, analysis):
+    import pandas as pd
+    started = time.perf_counter()
+    with stage("load"):
+        data = load_evaluation_set(madmom_folder, label_folder, label_store)
+    loaded = time.perf_counter()
 
-    results.append({
-        "song_id": "MEAN",
-        **{f"beat_{k}": v for k, v in extract_selected_metrics(beat_mean).items()},
-        **{f"downbeat_{k}": v for k, v in extract_selected_metrics(downbeat_mean).items()},
-    })
+    # Evaluate
+    with stage("evaluate"):
+        chunks = _chunks(data, chunk_size, analysis)
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                scores = [row for rows in pool.map(_evaluate_chunk, chunks) for row in rows]
+        else:
+            scores = [row for chunk in chunks for row in _evaluate_chunk(chunk)]
+    width = 2 * len(METRICS) + (len(METRIC_LEVELS) if analysis else 0)
+    scores = np.array(scores, dtype=float).reshape(-1, width)
+    scores, level_scores = scores[:, :2 * len(METRICS)], scores[:, 2 * len(METRICS):]
 
-    # Save
-    df = pd.DataFrame(results)
-    df.to_csv(output_csv, index=False)
+    columns = [f"beat_{k}" for k in METRICS] + [f"downbeat_{k}" for k in METRICS]
+    df = pd.DataFrame(scores, columns=columns)
+    df.insert(0, "song_id", data["song_ids"])
+    extreme = df[((scores == 0) | (scores == 1)).any(axis=1)]
+
+    # Mean evaluations (BeatMeanEvaluation is the NaN-ignoring mean of each metric)
+    with np.errstate(all='ignore'):
+        means = [np.nanmean(np.ascontiguousarray(column)) for column in scores.T]
+    df.loc[len(df)] = ["MEAN", *means]
+
+    with stage("write"):
+        _save(df, output_csv)
+    elapsed = time.perf_counter() - started
     print(f"✅ Evaluation (F-measure, CMLt, AMLt) complete. Saved to {output_csv}")
 
+    if analysis:
+        levels = pd.DataFrame(level_scores, columns=[f"fmeasure_{level}" for level in METRIC_LEVELS])
+        labels = metric_level_labels(level_scores) if len(level_scores) else np.array([], dtype=object)
+        levels.insert(0, "song_id", data["song_ids"])
+        levels.insert(1, "metric_level", labels)
+        extreme_path, levels_path = analysis_paths(output_csv)
+        with stage("write"):
+            _save(extreme, extreme_path)
+            _save(levels, levels_path)
+        counts = ", ".join(f"{level} {n}" for level, n in zip(*np.unique(labels, return_counts=True)))
+        print(f"📊 {len(extreme)} extreme songs saved to {extreme_path}; metric levels ({counts}) saved to {levels_path}")
+    if elapsed > 0:
+        print(f"⏱️ {len(scores)} songs in {elapsed:.2f}s ({len(scores) / elapsed:.1f} songs/s, "
+              f"loading {loaded - started:.2f}s)")
+
 if __name__ == "__main__":
     madmom_folder = "./madmom_results"
     label_folder = "./metered_beats"
     output_csv = "./nochange_f_cmlt_amlt_results.csv"
 
-    evaluate_folder_f_cmlt_amlt(madmom_folder, label_folder, output_csv)
+    evaluate_folder_f_cmlt_amlt(madmom_folder, label_folder, output_csv, workers=os.cpu_count() or 1)
@@ -1,78 +1,463 @@
 import os
-import json
-from madmom.features.downbeats import RNNDownBeatProcessor, DBNDownBeatTrackingProcessor
+import sys
+import time
+import sqlite3
+import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import instrumentation
+from audio_cache import DEFAULT_MAX_BYTES, AudioCache, file_md5
+from instrumentation import count, instrumented, stage
 
 # ===== Configuration =====
 AUDIO_FOLDER = './audio'
 OUTPUT_FOLDER = './madmom_results'
-CHECKPOINT_FILE = './processing_checkpoint.json'  # File to track progress
+CHECKPOINT_FILE = './processing_checkpoint.sqlite'  # Per-file status store, shared by concurrent runs
+STALE_AFTER = 3600  # Seconds before another run may reclaim an 'in_progress' file
+ACTIVATION_CACHE = './madmom_activations'  # <audio MD5>.npy RNN activations; None disables caching
+AUDIO_CACHE = None  # Folder of decoded PCM shared with other audio tools (see audio_cache); None decodes every time
+AUDIO_CACHE_MAX_BYTES = DEFAULT_MAX_BYTES
+RNN_WORKERS = 1  # RNN processes; DBN decoding of finished tracks overlaps with them
+DBN_WORKERS = 1  # DBN decoding processes
+LOOKAHEAD = 2  # tracks queued per worker; files are only claimed when they are queued
+FPS = 100
+SETTINGS = ("audio_folder", "output_folder", "checkpoint_file", "activation_cache", "audio_cache",
+            "audio_cache_max_bytes")
+
+def configure(**settings):
+    """Override the folder/file settings above by lowercase name (used by cli.py)."""
+    for name, value in settings.items():
+        if name not in SETTINGS:
+            raise TypeError(f"Unknown setting: {name}")
+        globals()[name.upper()] = value
 
-# Ensure folders exist
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+def current_settings():
+    return {name: globals()[name.upper()] for name in SETTINGS}
 
 # ===== Initialize Processors =====
-rnn_processor = RNNDownBeatProcessor()
-dbn_processor = DBNDownBeatTrackingProcessor(beats_per_bar=[3, 4], fps=100)
+# Built lazily (madmom included) so importing this module stays cheap and every
+# pool worker constructs each processor exactly once
+_processors = {}
+
+def get_rnn_processor():
+    if 'rnn' not in _processors:
+        from madmom.features.downbeats import RNNDownBeatProcessor
+        _processors['rnn'] = RNNDownBeatProcessor()
+    return _processors['rnn']
+
+def get_dbn_processor():
+    if 'dbn' not in _processors:
+        from madmom.features.downbeats import DBNDownBeatTrackingProcessor
+        _processors['dbn'] = DBNDownBeatTrackingProcessor(beats_per_bar=[3, 4], fps=FPS)
+    return _processors['dbn']
+
+def _init_worker(settings, get_processor=None):
+    """Pool initializer: apply the parent's settings, then build the worker's processor."""
+    configure(**settings)
+    if get_processor is not None:
+        get_processor()
+
+# ===== Activation Cache =====
+def activation_path(audio_path, md5=None):
+    return os.path.join(ACTIVATION_CACHE, f"{md5 or file_md5(audio_path)}.npy")
+
+_audio_cache = None
+
+def audio_input(audio_path, md5=None):
+    """What the RNN reads: the decoded signal from AUDIO_CACHE when set, else the path itself"""
+    global _audio_cache
+    if not AUDIO_CACHE:
+        return audio_path
+    if _audio_cache is None or _audio_cache.folder != AUDIO_CACHE:
+        _audio_cache = AudioCache(AUDIO_CACHE, AUDIO_CACHE_MAX_BYTES)
+    return _audio_cache.signal(audio_path, md5)
+
+def get_activations(audio_path):
+    """RNN downbeat activations, memory-mapped from ACTIVATION_CACHE when already computed"""
+    if not ACTIVATION_CACHE:
+        return get_rnn_processor()(audio_input(audio_path))
+    md5 = audio_md5(audio_path)
+    cache_path = activation_path(audio_path, md5)
+    if os.path.exists(cache_path):
+        return np.load(cache_path, mmap_mode='r')
+    downbeat_act = get_rnn_processor()(audio_input(audio_path, md5))
+    os.makedirs(ACTIVATION_CACHE, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, downbeat_act)
+    os.replace(tmp_path, cache_path)  # never leave a half-written .npy behind
+    return downbeat_act
 
 # ===== Checkpoint System =====
+# One row per audio file: in_progress / done / failed, with timings and error text.
+# Every update is a single SQLite transaction, so concurrent runs pointed at the
+# same AUDIO_FOLDER can share the store without clobbering each other.
+# A second table remembers each file's MD5 (the activation cache key) while its
+# size and mtime are unchanged, so reruns and sweeps don't hash every MP3 again.
+def _checkpoint_db():
+    conn = sqlite3.connect(CHECKPOINT_FILE, timeout=60)
+    conn.execute("""CREATE TABLE IF NOT EXISTS status (
+        filename TEXT PRIMARY KEY, state TEXT NOT NULL,
+        started REAL, finished REAL, seconds REAL, error TEXT)""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS audio_md5 (
+        filename TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, md5 TEXT NOT NULL)""")
+    return conn
+
+def load_md5s(audio_folder=None):
+    """{filename: md5} for every file in `audio_folder` whose size and mtime match the stored ones"""
+    audio_folder = audio_folder or AUDIO_FOLDER
+    conn = _checkpoint_db()
+    try:
+        rows = conn.execute("SELECT filename, size, mtime_ns, md5 FROM audio_md5").fetchall()
+    finally:
+        conn.close()
+    md5s = {}
+    for filename, size, mtime_ns, md5 in rows:
+        try:
+            st = os.stat(os.path.join(audio_folder, filename))
+        except FileNotFoundError:
+            continue
+        if (st.st_size, st.st_mtime_ns) == (size, mtime_ns):
+            md5s[filename] = md5
+    return md5s
+
+def audio_md5(audio_path):
+    """MD5 of an audio file from the store, hashing (and storing) it when unknown or changed"""
+    filename = os.path.basename(audio_path)
+    st = os.stat(audio_path)
+    conn = _checkpoint_db()
+    try:
+        row = conn.execute("SELECT size, mtime_ns, md5 FROM audio_md5 WHERE filename = ?", (filename,)).fetchone()
+        if row is not None and row[:2] == (st.st_size, st.st_mtime_ns):
+            return row[2]
+        md5 = file_md5(audio_path)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO audio_md5 VALUES (?, ?, ?, ?)",
+                         (filename, st.st_size, st.st_mtime_ns, md5))
+        return md5
+    finally:
+        conn.close()
+
 def load_checkpoint():
-    """Load last processed file from checkpoint"""
-    if os.path.exists(CHECKPOINT_FILE):
-        with open(CHECKPOINT_FILE, 'r') as f:
-            return json.load(f).get('last_processed')
-    return None
+    """Load {filename: state} for every file seen so far"""
+    conn = _checkpoint_db()
+    try:
+        return dict(conn.execute("SELECT filename, state FROM status"))
+    finally:
+        conn.close()
+
+def claim_file(filename, retry_failed=False):
+    """Atomically mark a file in_progress; False if it is done, failed or claimed by a live run
+
+    A 'done' file whose outputs have since been deleted is claimed again.
+    """
+    now = time.time()
+    conn = _checkpoint_db()
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT state, started FROM status WHERE filename = ?", (filename,)).fetchone()
+            if row is not None:
+                state, started = row
+                base_name = os.path.splitext(filename)[0]
+                outputs_exist = os.path.exists(os.path.join(OUTPUT_FOLDER, f'{base_name}_beats.txt')) \
+                    and os.path.exists(os.path.join(OUTPUT_FOLDER, f'{base_name}_downbeats.txt'))
+                if (state == 'done' and outputs_exist) or (state == 'failed' and not retry_failed):
+                    return False
+                if state == 'in_progress' and now - started < STALE_AFTER:
+                    return False
+            conn.execute("INSERT OR REPLACE INTO status VALUES (?, 'in_progress', ?, NULL, NULL, NULL)",
+                         (filename, now))
+            return True
+    finally:
+        conn.close()
 
-def save_checkpoint(filename):
-    """Save progress to checkpoint file"""
-    with open(CHECKPOINT_FILE, 'w') as f:
-        json.dump({'last_processed': filename}, f)
+def save_checkpoint(filename, error=None):
+    """Record a claimed file as done, or failed with its error text"""
+    now = time.time()
+    conn = _checkpoint_db()
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE status SET state = ?, finished = ?, seconds = ? - started, error = ? WHERE filename = ?",
+                ('failed' if error else 'done', now, now, error, filename))
+    finally:
+        conn.close()
+
+def has_outputs(audio_file, output_names):
+    base_name = os.path.splitext(audio_file)[0]
+    return f'{base_name}_beats.txt' in output_names and f'{base_name}_downbeats.txt' in output_names
 
 # ===== Processing Function =====
+def save_results(audio_path, beat_downbeat_times, output_folder=None):
+    """Write <name>_beats.txt and <name>_downbeats.txt for one track"""
+    output_folder = output_folder or OUTPUT_FOLDER
+    base_name = os.path.splitext(os.path.basename(audio_path))[0]
+    beats_path = os.path.join(output_folder, f'{base_name}_beats.txt')
+    downbeats_path = os.path.join(output_folder, f'{base_name}_downbeats.txt')
+
+    with open(beats_path, 'w') as bf, open(downbeats_path, 'w') as df:
+        for beat_time, beat_num in beat_downbeat_times:
+            bf.write(f"{beat_time:.4f}\n")
+            if beat_num == 1:
+                df.write(f"{beat_time:.4f}\n")
+
 def process_audio_file(audio_path):
-    """Process single audio file and save results"""
+    """Process single audio file and save results; returns the audio length in seconds"""
     try:
         # Process with Madmom
-        downbeat_act = rnn_processor(audio_path)
-        beat_downbeat_times = dbn_processor(downbeat_act)
-        
-        # Prepare output paths
-        base_name = os.path.splitext(os.path.basename(audio_path))[0]
-        beats_path = os.path.join(OUTPUT_FOLDER, f'{base_name}_beats.txt')
-        downbeats_path = os.path.join(OUTPUT_FOLDER, f'{base_name}_downbeats.txt')
-        
-        # Save results
-        with open(beats_path, 'w') as bf, open(downbeats_path, 'w') as df:
-            for beat_time, beat_num in beat_downbeat_times:
-                bf.write(f"{beat_time:.4f}\n")
-                if beat_num == 1:
-                    df.write(f"{beat_time:.4f}\n")
-        
+        with stage("track_rnn"):
+            downbeat_act = get_activations(audio_path)
+        with stage("track_dbn"):
+            beat_downbeat_times = get_dbn_processor()(downbeat_act)
+        with stage("write"):
+            save_results(audio_path, beat_downbeat_times)
+
         # Update checkpoint
         save_checkpoint(os.path.basename(audio_path))
         print(f"✅ Successfully processed {os.path.basename(audio_path)}")
-        
+        return len(downbeat_act) / FPS
+
     except Exception as e:
+        save_checkpoint(os.path.basename(audio_path), error=str(e))
+        count("error")
         print(f"❌ Failed to process {os.path.basename(audio_path)}: {str(e)}")
+        return None
+
+# ===== Parallel Pipeline =====
+def _rnn_stage(audio_path):
+    """RNN worker: audio file -> (downbeat activations, seconds spent)"""
+    started = time.perf_counter()
+    downbeat_act = np.asarray(get_activations(audio_path))
+    return downbeat_act, time.perf_counter() - started
+
+def _dbn_stage(audio_path, downbeat_act):
+    """DBN worker: activations -> beats/downbeats on disk; returns (audio seconds, {stage: seconds})"""
+    started = time.perf_counter()
+    beat_downbeat_times = get_dbn_processor()(downbeat_act)
+    decoded = time.perf_counter()
+    save_results(audio_path, beat_downbeat_times)
+    return len(downbeat_act) / FPS, {"track_dbn": decoded - started, "write": time.perf_counter() - decoded}
+
+def process_parallel(audio_paths, on_done, rnn_workers=RNN_WORKERS, dbn_workers=DBN_WORKERS):
+    """Run the RNN in one process pool while a second pool decodes finished activations.
+
+    Even with one worker each, track N+1 goes through the RNN while track N is
+    decoded. `audio_paths` is consumed lazily: at most LOOKAHEAD tracks per
+    worker are queued in each stage, so a generator that claims files as it
+    yields them (see main) only holds claims on tracks that are about to run.
+    `on_done(audio_path, audio_seconds, error, stage_seconds)` is called in this
+    process for every finished track (audio_seconds is None and error set on
+    failure); stage_seconds holds the worker time of the stages it completed,
+    under the same names as serial mode (track_rnn, track_dbn, write).
+    """
+    def report(audio_path, audio_seconds, error, stage_seconds):
+        if error is None:
+            print(f"✅ Successfully processed {os.path.basename(audio_path)}")
+        else:
+            print(f"❌ Failed to process {os.path.basename(audio_path)}: {error}")
+        on_done(audio_path, audio_seconds, error, stage_seconds)
+
+    settings = current_settings()
+    with ProcessPoolExecutor(rnn_workers, initializer=_init_worker,
+                             initargs=(settings, get_rnn_processor)) as rnn_pool, \
+            ProcessPoolExecutor(dbn_workers, initializer=_init_worker,
+                                initargs=(settings, get_dbn_processor)) as dbn_pool:
+        audio_paths = iter(audio_paths)
+        computing, decoding = {}, {}
+        rnn_seconds = {}  # audio path -> RNN time, while its DBN stage runs
+        exhausted = False
+        while True:
+            # Top up the RNN queue, unless the DBN stage is falling behind
+            while not exhausted and len(computing) < rnn_workers * LOOKAHEAD \
+                    and len(computing) + len(decoding) < (rnn_workers + dbn_workers) * LOOKAHEAD:
+                audio_path = next(audio_paths, None)
+                if audio_path is None:
+                    exhausted = True
+                else:
+                    computing[rnn_pool.submit(_rnn_stage, audio_path)] = audio_path
+            if not computing and not decoding:
+                break
+            done, _ = wait([*computing, *decoding], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in computing:
+                    audio_path = computing.pop(future)
+                    try:
+                        downbeat_act, rnn_seconds[audio_path] = future.result()
+                        decoding[dbn_pool.submit(_dbn_stage, audio_path, downbeat_act)] = audio_path
+                    except Exception as e:
+                        report(audio_path, None, str(e), {})
+                else:
+                    audio_path = decoding.pop(future)
+                    stage_seconds = {"track_rnn": rnn_seconds.pop(audio_path)}
+                    try:
+                        audio_seconds, dbn_seconds = future.result()
+                        report(audio_path, audio_seconds, None, {**stage_seconds, **dbn_seconds})
+                    except Exception as e:
+                        report(audio_path, None, str(e), stage_seconds)
+
+# ===== DBN Parameter Sweep =====
+# Each config is a dict of DBNDownBeatTrackingProcessor keyword arguments plus a
+# "name" used as the output sub-folder. Activations are computed at 100 fps.
+SWEEP_CONFIGS = [
+    {"name": "bpb3-4", "beats_per_bar": [3, 4], "fps": 100},
+    {"name": "bpb4", "beats_per_bar": [4], "fps": 100},
+    {"name": "bpb3-4_tempo55-215", "beats_per_bar": [3, 4], "fps": 100, "min_bpm": 55, "max_bpm": 215},
+]
+
+_sweep_processors = {}
+
+def _sweep_processor(config):
+    name = config["name"]
+    if name not in _sweep_processors:
+        from madmom.features.downbeats import DBNDownBeatTrackingProcessor
+        kwargs = {k: v for k, v in config.items() if k != "name"}
+        _sweep_processors[name] = DBNDownBeatTrackingProcessor(**kwargs)
+    return _sweep_processors[name]
+
+def _sweep_stage(task):
+    """Sweep worker: decode one track's cached activations with every DBN config.
+
+    Returns (audio_path, cached, [(config name, error or None)]); the MD5 is
+    hashed here when the checkpoint store doesn't know it yet.
+    """
+    audio_path, md5, configs = task
+    try:
+        cache_path = activation_path(audio_path, md5 or audio_md5(audio_path))
+    except Exception as e:
+        return audio_path, True, [(config["name"], str(e)) for config in configs]
+    if not os.path.exists(cache_path):
+        return audio_path, False, []
+    downbeat_act = np.load(cache_path, mmap_mode='r')  # zero-copy view of the cached activations
+    results = []
+    for config in configs:
+        try:  # a bad config fails on its own, not the whole sweep
+            save_results(audio_path, _sweep_processor(config)(downbeat_act), os.path.join(OUTPUT_FOLDER, config["name"]))
+            results.append((config["name"], None))
+        except Exception as e:
+            results.append((config["name"], str(e)))
+    return audio_path, True, results
+
+def sweep_dbn(configs=SWEEP_CONFIGS, workers=os.cpu_count() or 1):
+    """Re-run only the DBN stage for every config over the cached activations.
+
+    Tracks without cached activations are skipped; run main() first to fill the cache.
+    """
+    audio_files = sorted(f for f in os.listdir(AUDIO_FOLDER) if f.lower().endswith('.mp3'))
+    md5s = load_md5s()
+    tasks = [(os.path.join(AUDIO_FOLDER, f), md5s.get(f), configs) for f in audio_files]
+
+    for config in configs:
+        os.makedirs(os.path.join(OUTPUT_FOLDER, config["name"]), exist_ok=True)
+
+    started = time.perf_counter()
+    num_tracks, failures, reported = 0, 0, set()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(current_settings(),)) as pool:
+        for audio_path, cached, results in pool.map(_sweep_stage, tasks, chunksize=8):
+            if not cached:
+                print(f"⚠️ No cached activations for {os.path.basename(audio_path)}, skipping")
+                continue
+            num_tracks += 1
+            for name, error in results:
+                if error is None:
+                    continue
+                failures += 1
+                if (name, error) not in reported:  # a broken config would repeat the same error per track
+                    reported.add((name, error))
+                    print(f"❌ [{name}] Failed to decode {os.path.basename(audio_path)}: {error}")
+    elapsed = time.perf_counter() - started
+    print(f"🎛️ Swept {len(configs)} DBN configs over {num_tracks} tracks "
+          f"in {elapsed:.1f}s ({failures} failures)")
+
+def print_throughput(num_files, audio_seconds, elapsed):
+    if not num_files or not elapsed:
+        return
+    line = f"⏱️ {num_files} files in {elapsed:.1f}s: {num_files / elapsed * 60:.1f} files/minute"
+    if audio_seconds:
+        line += f", {elapsed / (audio_seconds / 60):.2f}s per audio-minute"
+    print(line)
 
 # ===== Main Processing Loop =====
-def main():
-    # Get sorted list of audio files (MP3)
-    audio_files = sorted(
-        f for f in os.listdir(AUDIO_FOLDER) 
-        if f.lower().endswith(('.mp3')))
+def main(rnn_workers=RNN_WORKERS, dbn_workers=DBN_WORKERS, retry_failed=False, stats_path=None, serial=False):
+    """Track every unfinished MP3 in AUDIO_FOLDER.
+
+    The RNN and DBN run in separate worker pools (process_parallel); `serial`
+    tracks one file at a time in this process instead. `stats_path` writes a
+    timing summary there (see instrumentation): the track_rnn, track_dbn and
+    write stages, plus per-file times (claim to finish in the pipeline, so
+    queueing is included).
+    """
+    with instrumented("track", stats_path):
+        # Ensure folders exist
+        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+
+        # Get sorted list of audio files (MP3)
+        audio_files = sorted(
+            f for f in os.listdir(AUDIO_FOLDER) 
+            if f.lower().endswith(('.mp3')))
     
-    # Find where to resume
-    last_processed = load_checkpoint()
-    start_index = audio_files.index(last_processed) + 1 if last_processed in audio_files else 0
+        # Find what is left: anything without both output files, minus recorded failures
+        # unless retrying them. Existing outputs count as done whatever the store says.
+        statuses = load_checkpoint()
+        output_names = set(os.listdir(OUTPUT_FOLDER))
+        remaining = [f for f in audio_files if not has_outputs(f, output_names)]
+        failed = [f for f in remaining if statuses.get(f) == 'failed']
+        if not retry_failed:
+            remaining = [f for f in remaining if statuses.get(f) != 'failed']
     
-    print(f"Found {len(audio_files)} files. Resuming from #{start_index + 1}...")
+        print(f"Found {len(audio_files)} files: {len(audio_files) - len(remaining)} done or skipped, "
+              f"{len(failed)} previously failed{' (retrying)' if retry_failed else ''}, "
+              f"{len(remaining)} to process...")
     
-    # Process files
-    for i in range(start_index, len(audio_files)):
-        audio_file = audio_files[i]
-        process_audio_file(os.path.join(AUDIO_FOLDER, audio_file))
-        print(f"Progress: {i + 1}/{len(audio_files)} ({((i + 1)/len(audio_files))*100:.1f}%)")
+        started = time.perf_counter()
+        num_tracked, audio_seconds_total = 0, 0.0
+        num_done = 0
+
+        if not serial:
+            claimed_at = {}
+
+            def claimed_paths():
+                for audio_file in remaining:
+                    if claim_file(audio_file, retry_failed):
+                        claimed_at[audio_file] = time.perf_counter()
+                        yield os.path.join(AUDIO_FOLDER, audio_file)
+
+            def on_done(audio_path, audio_seconds, error, stage_seconds):
+                nonlocal num_done, num_tracked, audio_seconds_total
+                audio_file = os.path.basename(audio_path)
+                save_checkpoint(audio_file, error)
+                run = instrumentation.current()
+                if run is not None:  # claim-to-finish time, queueing included
+                    run.record_file(audio_file, time.perf_counter() - claimed_at.pop(audio_file))
+                    for name, seconds in stage_seconds.items():
+                        run.record_stage(name, seconds)
+                if error is not None:
+                    count("error")
+                if audio_seconds is not None:
+                    num_tracked += 1
+                    audio_seconds_total += audio_seconds
+                num_done += 1
+                print(f"Progress: {num_done}/{len(remaining)} ({(num_done/len(remaining))*100:.1f}%)")
+
+            process_parallel(claimed_paths(), on_done, rnn_workers, dbn_workers)
+        else:
+            # Process files
+            for audio_file in remaining:
+                num_done += 1
+                if not claim_file(audio_file, retry_failed):
+                    continue  # finished or claimed by a concurrent run
+                with instrumentation.track_file(audio_file):
+                    audio_seconds = process_audio_file(os.path.join(AUDIO_FOLDER, audio_file))
+                if audio_seconds is not None:
+                    num_tracked += 1
+                    audio_seconds_total += audio_seconds
+                print(f"Progress: {num_done}/{len(remaining)} ({(num_done/len(remaining))*100:.1f}%)")
+
+        print_throughput(num_tracked, audio_seconds_total, time.perf_counter() - started)
 
 if __name__ == "__main__":
-    main()
-    print("All files processed!")
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "sweep":
+        sweep_dbn()
+    else:
+        main(retry_failed=len(sys.argv) > 1 and sys.argv[1] == "retry-failed")
+        print("All files processed!")
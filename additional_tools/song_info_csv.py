@@ -1,115 +1,145 @@
 import os
-import zipfile
-import shutil
-import pandas as pd
-from mutagen.mp3 import MP3
-from mutagen.mp3 import HeaderNotFoundError
+import sys
+import numpy as np
 
-def get_mp3_duration_safe(file_path):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import instrumentation
+from build_cache import BuildCache
+from instrumentation import count, instrumented, stage
+from osz_archive import OszArchive
+from table_io import INFO_DICTIONARY_COLUMNS, INFO_TYPES, TableWriter
+
+SONG_INFO_COLUMNS = ("title", "artist", "creator", "tags", "num_timing_points", "num_uninherited_points",
+                     "mp3_duration_seconds", "song_name", "variation_rating_uninherited")
+
+def get_mp3_duration_safe(archive, member):
     try:
-        audio = MP3(file_path)
-        return audio.info.length
-    except (HeaderNotFoundError, Exception) as e:
-        print(f"Could not read MP3: {file_path}, error: {e}")
+        with stage("duration"):
+            return archive.mp3_duration(member)
+    except Exception as e:
+        print(f"Could not read MP3: {member} in {archive.path}, error: {e}")
         return None
 
-def parse_osu_file(osu_path):
-    metadata = {}
-    uninherited_count = 0
-    audio_filename = None
-    with open(osu_path, 'r', encoding='utf-8') as f:
-        section = None
-        for line in f:
-            line = line.strip()
-            if line.startswith('['):
-                section = line.strip()
-                continue
-
-            if section == "[General]" and line.startswith("AudioFilename:"):
-                audio_filename = line.split(":", 1)[1].strip()
-
-            elif section == "[Metadata]" and ":" in line:
-                key, value = line.split(":", 1)
-                metadata[key.strip()] = value.strip()
-
-            elif section == "[TimingPoints]":
-                parts = line.split(',')
-                if len(parts) > 6 and parts[6].isdigit():
-                    if int(parts[6]) == 1:
-                        uninherited_count += 1
-
+def summarize_beatmap(beatmap):
+    metadata = beatmap["metadata"]
+    timing_points = beatmap["timing_points"]
     return {
         "title": metadata.get("Title", "Unknown"),
         "artist": metadata.get("Artist", "Unknown"),
         "creator": metadata.get("Creator", "Unknown"),
         "tags": metadata.get("Tags", ""),
-        "audio_filename": audio_filename,
-        "num_uninherited_points": uninherited_count
+        "audio_filename": beatmap["general"].get("AudioFilename"),
+        "num_timing_points": len(timing_points),
+        "num_uninherited_points": int(timing_points["uninherited"].sum())
     }
 
-def process_osz_file(osz_path, temp_dir):
+def song_info_record(meta, duration, song_name):
+    """One CSV row from summarize_beatmap output and the MP3 duration in seconds"""
+    return {
+        "title": meta["title"],
+        "artist": meta["artist"],
+        "creator": meta["creator"],
+        "tags": meta["tags"],
+        "num_timing_points": meta["num_timing_points"],
+        "num_uninherited_points": meta["num_uninherited_points"],
+        "mp3_duration_seconds": duration,
+        "song_name": song_name
+    }
+
+def process_osz_file(osz_path):
     song_name = os.path.splitext(os.path.basename(osz_path))[0]
-    extract_path = os.path.join(temp_dir, song_name)
-    os.makedirs(extract_path, exist_ok=True)
 
     try:
-        with zipfile.ZipFile(osz_path, 'r') as zipf:
-            zipf.extractall(extract_path)
-
-        osu_files = [f for f in os.listdir(extract_path) if f.endswith(".osu")]
-        if not osu_files:
-            print(f"No .osu files found in {osz_path}")
-            return None
-
-        osu_path = os.path.join(extract_path, osu_files[0])
-        meta = parse_osu_file(osu_path)
-
-        audio_filename = meta["audio_filename"]
-        if audio_filename:
-            mp3_path = os.path.join(extract_path, audio_filename)
-            if os.path.isfile(mp3_path):
-                duration = get_mp3_duration_safe(mp3_path)
+        with stage("unzip"):
+            archive = OszArchive(osz_path)
+            osu_files = archive.osu_names()
+
+        with archive:
+            if not osu_files:
+                print(f"No .osu files found in {osz_path}")
+                count("no_osu")
+                return None
+
+            with stage("parse"):
+                meta = summarize_beatmap(archive.parse_osu(osu_files[0]))
+
+            audio_filename = meta["audio_filename"]
+            if audio_filename:
+                mp3_member = archive.find_member(audio_filename)
+                if mp3_member is not None:
+                    duration = get_mp3_duration_safe(archive, mp3_member)
+                    if duration is None:
+                        count("unreadable_duration")
+                else:
+                    print(f"MP3 file not found: {audio_filename} in {song_name}")
+                    count("missing_mp3")
+                    duration = None
             else:
-                print(f"MP3 file not found: {audio_filename} in {song_name}")
+                count("missing_audio_filename")
                 duration = None
-        else:
-            duration = None
-
-        return {
-            "title": meta["title"],
-            "artist": meta["artist"],
-            "creator": meta["creator"],
-            "tags": meta["tags"],
-            "num_uninherited_points": meta["num_uninherited_points"],
-            "mp3_duration_seconds": duration,
-            "song_name": song_name
-        }
+
+        return song_info_record(meta, duration, song_name)
 
     except Exception as e:
         print(f"Error processing {osz_path}: {e}")
+        count("error")
         return None
-    finally:
-        shutil.rmtree(extract_path, ignore_errors=True)
-
-def process_osz_folder(folder_path):
-    temp_dir = os.path.join(folder_path, "temp_extract")
-    os.makedirs(temp_dir, exist_ok=True)
-
-    records = []
-    for file in os.listdir(folder_path):
-        if file.endswith(".osz"):
-            full_path = os.path.join(folder_path, file)
-            data = process_osz_file(full_path, temp_dir)
-            if data:
-                records.append(data)
-
-    shutil.rmtree(temp_dir, ignore_errors=True)
-
-    df = pd.DataFrame(records)
-    if not df.empty:
-        df["variation_rating_uninherited"] = (df["num_uninherited_points"] - 1) / df["mp3_duration_seconds"]
-        df.to_csv(os.path.join(folder_path, "single_timing_song_info.csv"), index=False)
-        print("Saved .csv")
+
+def variation_rating(record):
+    """(uninherited points - 1) per second of audio; NaN when the duration is unknown"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        duration = record["mp3_duration_seconds"]
+        return float(np.float64(record["num_uninherited_points"] - 1) / np.float64(np.nan if duration is None else duration))
+
+def song_info_writer(output_path, batch_size=4096):
+    """TableWriter for song-info rows; .parquet paths get typed and dictionary-encoded columns (needs pyarrow)"""
+    return TableWriter(output_path, SONG_INFO_COLUMNS, types=INFO_TYPES,
+                       dictionary=INFO_DICTIONARY_COLUMNS, batch_size=batch_size)
+
+def add_song_info(writer, record):
+    with stage("write"):
+        writer.add({**record, "variation_rating_uninherited": variation_rating(record)})
+
+def process_osz_folder(folder_path, cache_path=None, output_path=None, stats_path=None):
+    """Stream one row per .osz into `output_path` (default single_timing_song_info.csv; .parquet also works)
+
+    `stats_path` writes a JSON run summary (see instrumentation).
+    """
+    with instrumented("song_info", stats_path):
+        output_path = output_path or os.path.join(folder_path, "single_timing_song_info.csv")
+
+        # Optional build_cache manifest: rows of unchanged archives are reused as-is
+        cache = BuildCache(cache_path) if cache_path else None
+
+        writer = song_info_writer(output_path)
+        for file in sorted(os.listdir(folder_path)):  # same row order as pipeline.run_pipeline
+            if file.endswith(".osz"):
+                full_path = os.path.join(folder_path, file)
+                cached = cache.lookup("song_info", full_path) if cache else None
+                if cached is not None:
+                    data = cached["payload"]
+                else:
+                    with instrumentation.track_file(file):
+                        data = process_osz_file(full_path)
+                    if data and cache:
+                        cache.record("song_info", full_path, payload=data)
+                if data:
+                    add_song_info(writer, data)
+
+        if cache:
+            cache.close()
+        _finish(writer)
+
+def write_song_info_csv(records, csv_path):
+    writer = song_info_writer(csv_path)
+    for record in records:
+        add_song_info(writer, record)
+    _finish(writer)
+
+def _finish(writer):
+    writer.close()
+    if writer.rows:
+        print(f"Saved {os.path.basename(writer.path)}")
     else:
         print("No valid data processed.")
 
@@ -0,0 +1,207 @@
+"""Consolidated binary store for metered beat annotations.
+
+Instead of one <song>_beats_metered.txt per song, all beats live in a single
+memory-mappable <name>.npy of (time, position) records, with a sidecar
+<name>.index.npz holding the song keys and their offsets into it. Song i is
+records[offsets[i]:offsets[i + 1]], so opening the store costs two file opens
+whatever the number of songs.
+
+ZipAnnotations reads the same annotations straight out of
+osu2beat2025_metered_beats.zip, without unpacking it.
+"""
+import os
+import re
+import zipfile
+from collections import OrderedDict
+from collections.abc import Mapping
+import numpy as np
+
+BEAT_DTYPE = np.dtype([
+    ("time", "f8"),      # seconds
+    ("position", "i1"),  # position in bar, 1 = downbeat
+])
+
+
+def _paths(store_path):
+    base = store_path[:-len(".npy")] if store_path.endswith(".npy") else store_path
+    return base + ".npy", base + ".index.npz"
+
+
+class AnnotationStore(Mapping):
+    """Read-only mapping of song key → structured (time, position) array view."""
+
+    def __init__(self, store_path):
+        data_path, index_path = _paths(store_path)
+        self.records = np.load(data_path, mmap_mode='r')
+        with np.load(index_path) as index:
+            self.keys_array = index["keys"]
+            self.offsets = index["offsets"]
+        self._positions = {key: i for i, key in enumerate(self.keys_array.tolist())}
+
+    def __getitem__(self, key):
+        i = self._positions[key]
+        return self.records[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        return iter(self.keys_array.tolist())
+
+    def __len__(self):
+        return len(self.keys_array)
+
+
+class AnnotationStoreWriter:
+    """Collect annotations and write them as one store on close().
+
+    Entries already in an existing store at `store_path` are carried over
+    unless re-added, so incremental conversions only supply the new songs.
+    """
+
+    def __init__(self, store_path, keep_existing=True):
+        self.store_path = store_path
+        self.data_path, self.index_path = _paths(store_path)
+        self._entries = {}
+        self._keep_existing = keep_existing
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, key, beat_times, beat_positions):
+        entry = np.empty(len(beat_times), dtype=BEAT_DTYPE)
+        entry["time"] = beat_times
+        entry["position"] = beat_positions
+        self._entries[key] = entry
+
+    def close(self):
+        data_path, index_path = self.data_path, self.index_path
+        entries = {}
+        if self._keep_existing and os.path.exists(data_path) and os.path.exists(index_path):
+            existing = AnnotationStore(self.store_path)
+            entries = {key: np.array(existing[key]) for key in existing if key not in self._entries}
+            del existing  # release the memory map before replacing the file
+        entries.update(self._entries)
+
+        keys = sorted(entries)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(entries[k]) for k in keys], out=offsets[1:])
+        records = np.concatenate([entries[k] for k in keys]) if keys else np.zeros(0, dtype=BEAT_DTYPE)
+
+        # Write next to the target and swap in, so readers never see a torn store
+        np.save(data_path + ".tmp.npy", records)
+        np.savez(index_path + ".tmp.npz", keys=np.array(keys, dtype=str), offsets=offsets)
+        os.replace(data_path + ".tmp.npy", data_path)
+        os.replace(index_path + ".tmp.npz", index_path)
+
+
+ZIP_MEMBER_PATTERN = re.compile(r"(?:.*/)?(?P<md5>[0-9a-f]{32})_(?P<beatmapset_id>\d+)_beats_metered\.txt$")
+
+
+def parse_annotation_name(name):
+    """'<MD5>_<BeatmapSetID>_beats_metered.txt' → (md5, beatmapset_id), or None for other names."""
+    match = ZIP_MEMBER_PATTERN.match(name)
+    return (match["md5"], int(match["beatmapset_id"])) if match else None
+
+
+def _decode_beats(blobs):
+    """Decode several annotation texts with one float conversion; returns (records, offsets)."""
+    tokens, counts = [], []
+    for blob in blobs:
+        fields = blob.split()
+        tokens.extend(fields)
+        counts.append(len(fields) // 2)
+    values = np.array(tokens, dtype=float).reshape(-1, 2)
+    records = np.empty(len(values), dtype=BEAT_DTYPE)
+    records["time"] = values[:, 0]
+    records["position"] = values[:, 1]
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return records, offsets
+
+
+def load_text(path):
+    """One <song>_beats_metered.txt as a (time, position) array."""
+    with open(path, 'rb') as f:
+        records, _ = _decode_beats([f.read()])
+    return records
+
+
+class ZipAnnotations(Mapping):
+    """Lazy mapping of '<MD5>_<BeatmapSetID>' → (time, position) array, read from a zip.
+
+    Members are decoded on first access and kept in an LRU cache of
+    `cache_size` songs. The archive is reopened per process, so instances can
+    be handed to multiprocessing / data-loader workers.
+    """
+
+    def __init__(self, zip_path, cache_size=256):
+        self.zip_path = zip_path
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._zip, self._pid = None, None
+        self._members = {}
+        self.info = {}  # key → (md5, beatmapset_id)
+        for name in self._archive().namelist():
+            parsed = parse_annotation_name(name)
+            if parsed:
+                key = f"{parsed[0]}_{parsed[1]}"
+                self._members[key] = name
+                self.info[key] = parsed
+
+    def _archive(self):
+        if self._zip is None or self._pid != os.getpid():
+            self._zip, self._pid = zipfile.ZipFile(self.zip_path, 'r'), os.getpid()
+        return self._zip
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_zip=None, _pid=None, _cache=OrderedDict())
+        return state
+
+    def __getitem__(self, key):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        records, _ = _decode_beats([self._archive().read(self._members[key])])
+        self._cache[key] = records
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return records
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
+
+    def load_all(self):
+        """Decode every member in one pass; returns (keys, records, offsets) like AnnotationStore."""
+        keys = sorted(self._members)
+        archive = self._archive()
+        records, offsets = _decode_beats([archive.read(self._members[key]) for key in keys])
+        return keys, records, offsets
+
+    def to_store(self, store_path):
+        """Convert the whole zip into an annotation store file."""
+        keys, records, offsets = self.load_all()
+        with AnnotationStoreWriter(store_path, keep_existing=False) as writer:
+            for i, key in enumerate(keys):
+                beats = records[offsets[i]:offsets[i + 1]]
+                writer.add(key, beats["time"], beats["position"])
+
+
+def open_annotations(path):
+    """AnnotationStore for a store file, ZipAnnotations for a .zip of _beats_metered.txt files."""
+    return ZipAnnotations(path) if path.endswith(".zip") else AnnotationStore(path)
+
+
+def export_text(store_path, annotation_folder):
+    """Write <key>_beats_metered.txt files, in the osu2beat2025 format, for every song in a store."""
+    os.makedirs(annotation_folder, exist_ok=True)
+    store = AnnotationStore(store_path)
+    for key in store:
+        beats = store[key]
+        np.savetxt(os.path.join(annotation_folder, f"{key}_beats_metered.txt"),
+                   np.column_stack((beats["time"], beats["position"])), fmt=("%.6f", "%d"), delimiter="\t")
+    print(f"✅ Exported {len(store)} annotations to {annotation_folder}")
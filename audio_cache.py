@@ -0,0 +1,126 @@
+"""Decode-once cache of mono PCM (and derived per-track features) shared by the audio tools.
+
+Each track is decoded a single time into <folder>/<audio MD5>.pcm<sample rate>.npy
+(int16 mono), which later readers memory-map instead of decoding the MP3
+again. `signal()` wraps the mapping in a madmom Signal without copying, so it
+can be passed straight to any madmom processor; `pcm()` is the bare array.
+`feature()` caches any array computed from the signal (onset envelopes,
+spectrogram frames, ...) next to it under the same key.
+
+The folder is bounded to `max_bytes`: after every write the least recently
+used files (by mtime, refreshed on each hit) are deleted until it fits.
+Writes go through a temporary file and os.replace, so concurrent processes
+can share one cache folder.
+"""
+import hashlib
+import os
+import numpy as np
+from instrumentation import stage
+
+SAMPLE_RATE = 44100
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class AudioCache:
+    def __init__(self, folder, max_bytes=DEFAULT_MAX_BYTES, sample_rate=SAMPLE_RATE):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.sample_rate = sample_rate
+        self.hits = self.misses = 0
+        self._keys = {}  # (path, size, mtime_ns) -> md5, so each file is hashed once per process
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, audio_path):
+        st = os.stat(audio_path)
+        memo = (os.path.abspath(audio_path), st.st_size, st.st_mtime_ns)
+        if memo not in self._keys:
+            self._keys[memo] = file_md5(audio_path)
+        return self._keys[memo]
+
+    def pcm(self, audio_path, md5=None):
+        """Read-only memory-mapped int16 mono samples of `audio_path`, decoding it on a miss."""
+        path = os.path.join(self.folder, f"{md5 or self.key(audio_path)}.pcm{self.sample_rate}.npy")
+        cached = self._load(path)
+        if cached is not None:
+            return cached
+        from madmom.io.audio import load_audio_file  # deferred: madmom is slow to import
+        with stage("decode"):
+            samples, _ = load_audio_file(audio_path, sample_rate=self.sample_rate, num_channels=1, dtype=np.int16)
+        return self._store(path, samples)
+
+    def signal(self, audio_path, md5=None):
+        """pcm() as a madmom Signal (a view, not a copy) for madmom processors."""
+        from madmom.audio.signal import Signal
+        return Signal(self.pcm(audio_path, md5), sample_rate=self.sample_rate, num_channels=1)
+
+    def feature(self, audio_path, name, compute, md5=None):
+        """Memory-mapped `compute(signal)` for `audio_path`, cached as <md5>.<name>.npy.
+
+        `name` must change whenever `compute`'s parameters do (e.g. "superflux100").
+        """
+        md5 = md5 or self.key(audio_path)
+        path = os.path.join(self.folder, f"{md5}.{name}.npy")
+        cached = self._load(path)
+        if cached is not None:
+            return cached
+        return self._store(path, np.asarray(compute(self.signal(audio_path, md5))))
+
+    def size(self):
+        return sum(size for _, _, size in self._entries())
+
+    def _load(self, path):
+        try:
+            array = np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            pass  # evicted by another process; the mapping stays valid
+        return array
+
+    def _store(self, path, array):
+        """Write `array` to `path`, evict down to max_bytes and return it memory-mapped."""
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)  # never leave a half-written .npy behind
+        stored = np.load(path, mmap_mode='r')
+        self._evict(keep=path)
+        return stored
+
+    def _entries(self):
+        """(mtime, path, size) of every cached file."""
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.npy') and '.tmp.' not in entry.name:
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, entry.path, st.st_size))
+        return entries
+
+    def _evict(self, keep=None):
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
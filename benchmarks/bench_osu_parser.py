@@ -0,0 +1,132 @@
+"""Micro-benchmark: unified osu_parser.parse_osu vs. the per-script loops it replaced.
+
+Before the shared parser, converting + partitioning + describing one beatmap
+scanned its .osu five times (three [TimingPoints] loops, a [General] rescan
+and a full-file metadata pass). This times those loops, reproduced verbatim
+below, against a single parse_osu call on a synthetic difficulty.
+
+    python benchmarks/bench_osu_parser.py [num_timing_points] [num_hit_objects]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from osu_parser import parse_osu
+
+
+def make_osu_lines(num_timing_points, num_hit_objects):
+    lines = ["osu file format v14", "", "[General]", "AudioFilename: audio.mp3", "",
+             "[Metadata]", "Title:Bench", "Artist:Bench", "Creator:Bench", "Tags:a b c", "",
+             "[TimingPoints]"]
+    for i in range(num_timing_points):
+        uninherited = 1 if i % 8 == 0 else 0
+        beat_length = 500 if uninherited else -100
+        lines.append(f"{i * 250},{beat_length},4,2,0,60,{uninherited},0")
+    lines += ["", "[HitObjects]"]
+    lines += [f"256,192,{i * 120},1,0,0:0:0:0:" for i in range(num_hit_objects)]
+    return [line + "\n" for line in lines]
+
+
+# --- Legacy loops (pre-osu_parser), one per script ---
+
+def legacy_conversion_timing(osu_lines):
+    timing_points = []
+    reading = False
+    for line in osu_lines:
+        line = line.strip()
+        if line == "[TimingPoints]":
+            reading = True
+            continue
+        if reading:
+            if line.startswith("["):
+                break
+            parts = line.split(",")
+            if len(parts) >= 7:
+                try:
+                    time = float(parts[0])
+                    beat_length = float(parts[1])
+                    meter = int(parts[2])
+                    if int(parts[6]) == 1:
+                        timing_points.append((time, beat_length, meter))
+                except ValueError:
+                    continue
+    timing_points.sort()
+    return timing_points
+
+
+def legacy_audio_filename(osu_lines):
+    in_general = False
+    for line in osu_lines:
+        line = line.strip()
+        if line == '[General]':
+            in_general = True
+            continue
+        if in_general:
+            if line.startswith('['):
+                break
+            if line.startswith('AudioFilename:'):
+                return line.split(':', 1)[1].strip()
+    return None
+
+
+def legacy_partition_timing(osu_lines):
+    timing_section = False
+    times = []
+    for line in osu_lines:
+        line = line.strip()
+        if line == "[TimingPoints]":
+            timing_section = True
+            continue
+        if timing_section:
+            if line == "" or line.startswith("["):
+                break
+            parts = line.split(",")
+            if len(parts) > 6 and int(parts[6]) == 1:
+                times.append(float(parts[0]))
+    return times
+
+
+def legacy_song_info(osu_lines):
+    metadata = {}
+    uninherited_count = 0
+    section = None
+    for line in osu_lines:
+        line = line.strip()
+        if line.startswith('['):
+            section = line
+            continue
+        if section == "[Metadata]" and ":" in line:
+            key, value = line.split(":", 1)
+            metadata[key.strip()] = value.strip()
+        elif section == "[TimingPoints]":
+            parts = line.split(',')
+            if len(parts) > 6 and parts[6].isdigit() and int(parts[6]) == 1:
+                uninherited_count += 1
+    return metadata, uninherited_count
+
+
+def legacy_all(osu_lines):
+    legacy_conversion_timing(osu_lines)
+    legacy_audio_filename(osu_lines)
+    legacy_partition_timing(osu_lines)
+    legacy_conversion_timing(osu_lines)  # extract_uninherited_timing_points used the same loop
+    legacy_song_info(osu_lines)
+
+
+def main():
+    num_timing_points = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    num_hit_objects = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    osu_lines = make_osu_lines(num_timing_points, num_hit_objects)
+
+    number = 200
+    legacy = min(timeit.repeat(lambda: legacy_all(osu_lines), number=number, repeat=5)) / number
+    unified = min(timeit.repeat(lambda: parse_osu(osu_lines), number=number, repeat=5)) / number
+
+    print(f"{num_timing_points} timing points, {num_hit_objects} hit objects")
+    print(f"legacy per-script loops: {legacy * 1e3:8.3f} ms/beatmap")
+    print(f"osu_parser.parse_osu:    {unified * 1e3:8.3f} ms/beatmap  ({legacy / unified:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Throughput benchmarks on a synthetic corpus (see synthetic_osz.py).
+
+Scenarios:
+    parse       parse_osu on every difficulty of every archive
+    beat_grid   extract_metered_beats_correct on every first difficulty
+    archive_io  data_conversion.process_all_osz (audio copy + annotations)
+    partition   data_partition.process_beatmaps on a hardlinked copy of the corpus
+    evaluation  madmom_evaluation.evaluate_folder_f_cmlt_amlt on jittered detections
+    startup     cli.py's light subcommands on an empty folder, against cli.STARTUP_TARGET_SECONDS
+
+Each scenario runs in its own interpreter so its peak RSS is its own.
+Results are printed as a table and can be saved as JSON (--json) and compared
+with an earlier run (--compare) to spot regressions between versions.
+
+    python benchmarks/run_benchmarks.py --count 100 --json after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'additional_tools'))
+
+SCENARIOS = ("parse", "beat_grid", "archive_io", "partition", "evaluation", "startup")
+
+
+def _osz_paths(corpus):
+    return sorted(os.path.join(corpus, f) for f in os.listdir(corpus) if f.endswith(".osz"))
+
+
+def _quiet(fn, *args, **kwargs):
+    """Run `fn` with stdout discarded (the scripts print one line per file)."""
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sys.stdout = stdout
+
+
+# ===== Scenarios: each returns (files processed, seconds) =====
+
+def bench_parse(corpus, scratch):
+    from osz_archive import OszArchive
+    paths = _osz_paths(corpus)
+    started = time.perf_counter()
+    for path in paths:
+        with OszArchive(path) as archive:
+            archive.parse_all_osu()
+    return len(paths), time.perf_counter() - started
+
+
+def bench_beat_grid(corpus, scratch, repeat=20):
+    from data_conversion import extract_metered_beats_correct
+    from osz_archive import OszArchive
+    inputs = []
+    for path in _osz_paths(corpus):
+        with OszArchive(path) as archive:
+            beatmap = archive.parse_osu(archive.osu_names()[0])
+            inputs.append((beatmap["timing_points"], archive.mp3_duration("audio.mp3") * 1000))
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for timing_points, duration_ms in inputs:
+            extract_metered_beats_correct(timing_points, duration_ms)
+    return len(inputs) * repeat, time.perf_counter() - started
+
+
+def bench_archive_io(corpus, scratch):
+    from data_conversion import process_all_osz
+    folder = _link_corpus(corpus, os.path.join(scratch, "archive_io"))
+    started = time.perf_counter()
+    summary = _quiet(process_all_osz, folder, verbose=False)
+    return summary["total"], time.perf_counter() - started
+
+
+def bench_partition(corpus, scratch):
+    from data_partition import process_beatmaps
+    folder = _link_corpus(corpus, os.path.join(scratch, "partition"))
+    outputs = [os.path.join(scratch, "partition_" + name) for name in ("single", "geq5", "le5")]
+    count = len(_osz_paths(folder))
+    started = time.perf_counter()
+    _quiet(process_beatmaps, folder, *outputs)
+    return count, time.perf_counter() - started
+
+
+def bench_evaluation(corpus, scratch):
+    from madmom_evaluation import evaluate_folder_f_cmlt_amlt
+    labels, detections = _evaluation_data(corpus, os.path.join(scratch, "evaluation"))
+    started = time.perf_counter()
+    _quiet(evaluate_folder_f_cmlt_amlt, detections, labels, os.path.join(scratch, "evaluation.csv"))
+    return len(os.listdir(labels)), time.perf_counter() - started
+
+
+def bench_startup(corpus, scratch, repeat=3):
+    """Best of `repeat` fresh-interpreter runs per light subcommand; seconds is the slowest command."""
+    import cli
+    empty = os.path.join(scratch, "empty")
+    os.makedirs(empty, exist_ok=True)
+    startup = {}
+    for command in cli.LIGHT_COMMANDS:
+        runs = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(ROOT, "cli.py"), command, empty],
+                           cwd=scratch, capture_output=True, check=True)
+            runs.append(time.perf_counter() - started)
+        startup[command] = min(runs)
+    return len(startup), max(startup.values()), {"startup_seconds": startup,
+                                                  "target_seconds": cli.STARTUP_TARGET_SECONDS}
+
+
+# ===== Setup helpers (untimed) =====
+
+def _link_corpus(corpus, folder):
+    """Hardlink (or copy) the corpus into `folder`, so scenarios that move or add files leave it intact."""
+    from build_cache import link_or_copy
+    os.makedirs(folder, exist_ok=True)
+    for path in _osz_paths(corpus):
+        link_or_copy(path, os.path.join(folder, os.path.basename(path)))
+    return folder
+
+
+def _evaluation_data(corpus, folder, jitter_s=0.02, seed=0):
+    """Ground truth from the corpus plus madmom-style detections with Gaussian timing jitter."""
+    import numpy as np
+    from data_conversion import extract_metered_beats_correct, write_metered_beats
+    from osz_archive import OszArchive
+    rng = np.random.default_rng(seed)
+    labels, detections = os.path.join(folder, "labels"), os.path.join(folder, "detections")
+    os.makedirs(labels, exist_ok=True)
+    os.makedirs(detections, exist_ok=True)
+    for path in _osz_paths(corpus):
+        song = os.path.splitext(os.path.basename(path))[0]
+        with OszArchive(path) as archive:
+            beatmap = archive.parse_osu(archive.osu_names()[0])
+            duration_ms = archive.mp3_duration("audio.mp3") * 1000
+        times, positions = extract_metered_beats_correct(beatmap["timing_points"], duration_ms)
+        write_metered_beats(os.path.join(labels, f"{song}_beats_metered.txt"), times, positions)
+        detected = np.sort(times + rng.normal(0, jitter_s, len(times)))
+        np.savetxt(os.path.join(detections, f"{song}_beats.txt"), detected, fmt="%.4f")
+        np.savetxt(os.path.join(detections, f"{song}_downbeats.txt"), detected[positions == 1], fmt="%.4f")
+    return labels, detections
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+def run_scenario(name, corpus, scratch):
+    """Child-process entry point: run one scenario and print its result as a JSON line."""
+    try:
+        files, seconds, *extra = globals()[f"bench_{name}"](corpus, scratch)
+    except ImportError as e:
+        print(json.dumps({"scenario": name, "skipped": str(e)}))
+        return
+    print(json.dumps({"scenario": name, "files": files, "seconds": seconds,
+                      "files_per_sec": files / seconds if seconds > 0 else None,
+                      "peak_rss_mb": _peak_rss_mb(), **(extra[0] if extra else {})}))
+
+
+def _spawn(name, corpus, scratch):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name,
+                             "--corpus", corpus, "--scratch", scratch],
+                            capture_output=True, text=True)
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode != 0 or not lines:
+        return {"scenario": name, "error": result.stderr.strip().splitlines()[-1:] or ["no output"]}
+    return json.loads(lines[-1])
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "-C", ROOT, "describe", "--always", "--dirty"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results, baseline=None):
+    previous = {r["scenario"]: r for r in (baseline or {}).get("scenarios", [])}
+    print(f"{'scenario':<12}{'files':>8}{'seconds':>10}{'files/s':>10}{'peak MB':>10}{'vs base':>9}")
+    for r in results:
+        if "files" not in r:
+            print(f"{r['scenario']:<12}  ⚠️ {r.get('skipped') or r.get('error')}")
+            continue
+        ratio = ""
+        before = previous.get(r["scenario"], {}).get("files_per_sec")
+        if before and r["files_per_sec"]:
+            ratio = f"{r['files_per_sec'] / before:.2f}x"
+        print(f"{r['scenario']:<12}{r['files']:>8}{r['seconds']:>10.3f}{r['files_per_sec']:>10.1f}"
+              f"{r['peak_rss_mb']:>10.1f}{ratio:>9}")
+    for r in results:
+        target = r.get("target_seconds")
+        for command, seconds in r.get("startup_seconds", {}).items():
+            mark = "⚠️ over" if seconds > target else "✅"
+            print(f"  {command:<12} starts in {seconds:.3f}s {mark} target {target:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=50, help="archives in the synthetic corpus")
+    parser.add_argument("--length", type=float, default=180.0, help="mean map length in seconds")
+    parser.add_argument("--timing-points", type=int, default=64)
+    parser.add_argument("--difficulties", type=int, default=4)
+    parser.add_argument("--asset-mb", type=float, default=2.0, help="bulky non-audio assets per archive")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--corpus", help="reuse an existing corpus folder instead of generating one")
+    parser.add_argument("--json", help="write results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare files/s against")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--scratch", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_scenario(args.child, args.corpus, args.scratch)
+        return
+
+    from synthetic_osz import make_corpus
+    workdir = tempfile.mkdtemp(prefix="osu2mir_bench_")
+    try:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = os.path.join(workdir, "corpus")
+            make_corpus(corpus, args.count, length_s=args.length, num_timing_points=args.timing_points,
+                        num_difficulties=args.difficulties, asset_bytes=int(args.asset_mb * 1024 * 1024))
+        results = []
+        for name in args.scenarios:
+            scratch = os.path.join(workdir, name)
+            os.makedirs(scratch)
+            results.append(_spawn(name, corpus, scratch))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"revision": _git_revision(), "python": platform.python_version(), "machine": platform.machine(),
+              "config": {k: getattr(args, k) for k in ("count", "length", "timing_points", "difficulties", "asset_mb")},
+              "scenarios": results}
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Saved {args.json}")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -0,0 +1,104 @@
+"""Synthetic .osz corpus for benchmarks, so no real beatmap download is needed.
+
+Each archive holds `num_difficulties` .osu files, an MP3 made of valid
+MPEG-1 Layer III frames (128 kbit/s, 44.1 kHz, random payload so it doesn't
+compress, behind a small ID3v2 tag) and `asset_bytes` of incompressible
+"background/hitsound" members that the scripts should never read.
+
+    python benchmarks/synthetic_osz.py <folder> [count]
+"""
+import os
+import sys
+import zipfile
+import numpy as np
+
+SAMPLE_RATE = 44100
+BITRATE = 128000
+SAMPLES_PER_FRAME = 1152
+_FRAME_HEADER = b"\xff\xfb\x90\x64"  # MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, joint stereo, no padding
+
+
+def mp3_bytes(length_s, rng):
+    """CBR MP3 of `length_s` seconds; padding slots follow the encoder pattern so the average bitrate is exact."""
+    num_frames = int(np.ceil(length_s * SAMPLE_RATE / SAMPLES_PER_FRAME))
+    exact = SAMPLES_PER_FRAME // 8 * BITRATE / SAMPLE_RATE  # 417.96 bytes
+    base = int(exact)
+    # frame k is padded when the running byte total would otherwise fall behind
+    padded = np.diff(np.floor(np.arange(num_frames + 1) * (exact - base))).astype(bool)
+    payload = rng.bytes(num_frames * (base + 1))
+
+    id3 = b"ID3\x04\x00\x00\x00\x00\x02\x00" + bytes(256)  # 256-byte empty ID3v2.4 tag
+    frames, pos = [id3], 0
+    for pad in padded:
+        length = base + pad
+        header = _FRAME_HEADER[:2] + bytes([_FRAME_HEADER[2] | (0x02 if pad else 0)]) + _FRAME_HEADER[3:]
+        frames.append(header + payload[pos:pos + length - 4])
+        pos += length
+    return b"".join(frames)
+
+
+def osu_text(audio_filename, set_id, version, length_s, num_timing_points, red_every=8, offset_ms=120.0,
+             beat_length=500.0, hit_objects_per_s=3.0):
+    """One difficulty: every `red_every`-th timing point is a red line, the rest are SV changes."""
+    lines = ["osu file format v14", "",
+             "[General]", f"AudioFilename: {audio_filename}", "AudioLeadIn: 0", "PreviewTime: 1000", "Mode: 0", "",
+             "[Editor]", "DistanceSpacing: 1", "BeatDivisor: 4", "",
+             "[Metadata]", f"Title:Synthetic {set_id}", "Artist:Benchmark", f"Creator:Mapper{set_id % 97}",
+             f"Version:{version}", "Tags:synthetic benchmark corpus", f"BeatmapSetID:{set_id}", "",
+             "[Difficulty]", "HPDrainRate:5", "CircleSize:4", "OverallDifficulty:7", "ApproachRate:9", "",
+             "[Events]", "//Background and Video events", '0,0,"bg.jpg",0,0', "",
+             "[TimingPoints]"]
+    spacing = max(length_s * 1000 / max(num_timing_points, 1), 1.0)
+    for i in range(num_timing_points):
+        time = offset_ms + i * spacing
+        if i % red_every == 0:
+            meter = 3 if (i // red_every) % 5 == 4 else 4
+            lines.append(f"{time:g},{beat_length - (i // red_every) % 3},{meter},2,0,60,1,0")
+        else:
+            lines.append(f"{time:g},{-100 + i % 50},4,2,0,60,0,0")
+    lines += ["", "[Colours]", "Combo1 : 255,128,0", "", "[HitObjects]"]
+    num_objects = int(length_s * hit_objects_per_s)
+    lines += [f"{64 + i * 37 % 384},{48 + i * 53 % 288},{int(offset_ms + i * 1000 / hit_objects_per_s)},1,0,0:0:0:0:"
+              for i in range(num_objects)]
+    return "\r\n".join(lines) + "\r\n"
+
+
+def make_osz(path, set_id, length_s=180.0, num_timing_points=64, num_difficulties=4, distinct_timings=1,
+             asset_bytes=2 * 1024 * 1024, seed=0):
+    """Write one synthetic beatmap set; difficulties cycle through `distinct_timings` offsets of the same timing."""
+    rng = np.random.default_rng(seed)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for d in range(num_difficulties):
+            version = f"Diff {d}"
+            offset = 120.0 + 10.0 * (d % distinct_timings)
+            z.writestr(f"Benchmark - Synthetic {set_id} (Mapper) [{version}].osu",
+                       osu_text("audio.mp3", set_id, version, length_s, num_timing_points, offset_ms=offset))
+        z.writestr("audio.mp3", mp3_bytes(length_s, rng))
+        if asset_bytes:
+            z.writestr("bg.jpg", rng.bytes(asset_bytes * 3 // 4))
+            for i in range(4):
+                z.writestr(f"normal-hitclap{i}.wav", rng.bytes(asset_bytes // 16))
+
+
+def make_corpus(folder, count=50, seed=0, **options):
+    """`count` archives named "<set id> Benchmark - Synthetic.osz"; returns their paths.
+
+    Lengths vary between 0.5x and 1.5x `length_s` so archives differ in size.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    base_length = options.pop("length_s", 180.0)
+    paths = []
+    for i in range(count):
+        set_id = 100000 + i
+        path = os.path.join(folder, f"{set_id} Benchmark - Synthetic.osz")
+        make_osz(path, set_id, length_s=base_length * rng.uniform(0.5, 1.5), seed=seed + i, **options)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else "./bench_corpus"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    make_corpus(folder, count)
+    print(f"✅ Wrote {count} synthetic .osz files to {folder}")
@@ -0,0 +1,156 @@
+"""Persistent manifest that lets the conversion scripts skip unchanged inputs.
+
+Each processed .osz is recorded per stage (convert, timing_json, song_info,
+partition) with its size, mtime, the MD5 of its audio, the files it produced
+and an optional JSON payload. An input is fresh while its size and mtime are
+unchanged and every recorded output still exists, so re-running a script after
+adding new beatmaps only touches the delta.
+
+Audio is also indexed by MD5 (and by the zip member's CRC-32 + size, which is
+known without reading the MP3), so an MP3 shared by several beatmap sets is
+copied once and hardlinked everywhere else. A recorded copy is only linked
+while it still has the member's size and its recorded MD5.
+"""
+import json
+import os
+import shutil
+import sqlite3
+from audio_cache import file_md5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inputs (
+    stage TEXT NOT NULL,
+    key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    audio_md5 TEXT,
+    outputs TEXT NOT NULL,
+    payload TEXT,
+    PRIMARY KEY (stage, key)
+);
+CREATE TABLE IF NOT EXISTS audio (
+    md5 TEXT PRIMARY KEY,
+    crc INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS audio_crc_size ON audio (crc, size);
+"""
+
+
+class BuildCache:
+    def __init__(self, db_path, commit_every=200):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        self._conn.executescript(_SCHEMA)
+        self._commit_every = commit_every
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def lookup(self, stage, path, key=None):
+        """The recorded entry for `path` if it is still fresh, else None.
+
+        `key` defaults to the absolute path; pass a stable name instead when the
+        input moves between runs (as data_partition does).
+        """
+        key = key or os.path.abspath(path)
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, audio_md5, outputs, payload FROM inputs WHERE stage = ? AND key = ?",
+            (stage, key)).fetchone()
+        if row is None:
+            return None
+        size, mtime_ns, audio_md5, outputs, payload = row
+        st = os.stat(path)
+        outputs = json.loads(outputs)
+        if st.st_size != size or st.st_mtime_ns != mtime_ns or not all(map(os.path.exists, outputs)):
+            return None
+        return {
+            "audio_md5": audio_md5,
+            "outputs": outputs,
+            "payload": json.loads(payload) if payload is not None else None,
+        }
+
+    def record(self, stage, path, outputs=(), audio_md5=None, payload=None, key=None):
+        key = key or os.path.abspath(path)
+        st = os.stat(path)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO inputs VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (stage, key, st.st_size, st.st_mtime_ns, audio_md5,
+             json.dumps([os.path.abspath(p) for p in outputs]),
+             json.dumps(payload) if payload is not None else None))
+        self._maybe_commit()
+
+    def record_audio(self, md5, crc, size, path):
+        """Remember the latest materialized copy of an MP3; later copies hardlink to it."""
+        self._conn.execute("INSERT OR REPLACE INTO audio VALUES (?, ?, ?, ?)",
+                           (md5, crc, size, os.path.abspath(path)))
+        self._maybe_commit()
+
+    def known_audio(self):
+        """{(crc, size): (md5, path)} for every recorded MP3 that still exists on disk."""
+        return {
+            (crc, size): (md5, path)
+            for md5, crc, size, path in self._conn.execute("SELECT md5, crc, size, path FROM audio")
+            if os.path.isfile(path)
+        }
+
+    def _maybe_commit(self):
+        self._pending += 1
+        if self._pending >= self._commit_every:
+            self._conn.commit()
+            self._pending = 0
+
+
+def link_or_copy(src, dest):
+    """Hardlink `src` to `dest`, copying when the filesystem can't link."""
+    if os.path.abspath(src) == os.path.abspath(dest):
+        return
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+def audio_hit(known_audio, info, check_md5=True):
+    """(md5, path) of an earlier copy of the zip member `info` from `known_audio`, or None.
+
+    The CRC-32 + size key only picks the candidate: the file must still have the
+    member's size and (with `check_md5`) its recorded MD5, since it may have
+    been rewritten since it was recorded.
+    """
+    hit = known_audio.get((info.CRC, info.file_size)) if known_audio else None
+    if hit is None:
+        return None
+    try:
+        if os.path.getsize(hit[1]) != info.file_size or (check_md5 and file_md5(hit[1]) != hit[0]):
+            return None
+    except FileNotFoundError:
+        return None
+    return hit
+
+
+def copy_audio_dedup(archive, member, dest_path, known_audio=None):
+    """Materialize an MP3 member at `dest_path` and return (md5, crc, size).
+
+    If `known_audio` (see BuildCache.known_audio) already holds identical audio,
+    the earlier copy is hardlinked instead of decompressing the member again.
+    """
+    info = archive.getinfo(member)
+    hit = audio_hit(known_audio, info)
+    if hit is not None:
+        link_or_copy(hit[1], dest_path)
+        md5 = hit[0]
+    else:
+        md5 = archive.copy_member(member, dest_path)
+    return md5, info.CRC, info.file_size
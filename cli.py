@@ -0,0 +1,227 @@
+"""Command-line entry point for the osu2mir scripts.
+
+    python cli.py partition ./osz_folder
+    python cli.py convert ./osz_folder --workers 8 --stats stats.json
+    python cli.py timing-json ./osz_folder
+    python cli.py song-info ./osz_folder --output info.parquet
+    python cli.py track --audio ./audio --output ./madmom_results
+    python cli.py evaluate ./madmom_results ./metered_beats results.csv
+    python cli.py align ./osz_folder/new_audio ./osz_folder/metered_beats alignment.csv
+    python cli.py export ./osz_folder ./training_shards --info info.parquet
+
+Each subcommand imports its script only when it runs, so `--help` and the
+light subcommands never import madmom or pandas, and the madmom models are
+only built once tracking starts. `python cli.py <command> --help` lists the
+options; they mirror the keyword arguments of the scripts' entry points.
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Subcommands that should start quickly (no madmom/pandas); checked by the
+# "startup" scenario in benchmarks/run_benchmarks.py
+LIGHT_COMMANDS = ("partition", "convert", "timing-json", "song-info")
+STARTUP_TARGET_SECONDS = 0.4  # interpreter start to exit on an empty folder (measured ~0.25s)
+
+PARTITION_FOLDERS = ("single_timing_point", "timing_5s_or_more_apart", "timing_less_than_5s_apart")
+DIFFICULTY_MODES = ("first", "consensus", "all")  # data_conversion.DIFFICULTY_MODES
+
+
+def _import_tool(name):
+    """Import a script from additional_tools/ (they are not a package)."""
+    tools = os.path.join(ROOT, 'additional_tools')
+    if tools not in sys.path:
+        sys.path.insert(0, tools)
+    return __import__(name)
+
+
+# ===== Subcommands =====
+
+def cmd_partition(args):
+    import data_partition
+    folders = [os.path.join(args.output, name) for name in PARTITION_FOLDERS]
+    if args.mode == 'move':
+        data_partition.process_beatmaps(args.folder, *folders, cache_path=args.cache, stats_path=args.stats,
+                                        min_separation=args.min_separation)
+        return
+    index_path = args.index or os.path.join(args.folder, 'classification_index.npz')
+    data_partition.build_classification_index(args.folder, index_path, cache_path=args.cache, stats_path=args.stats)
+    index = data_partition.load_classification_index(index_path)
+    categories = data_partition.classify_index(index, min_separation=args.min_separation)
+    data_partition.materialize_subsets(index, categories, dict(zip(data_partition.CATEGORIES, folders)),
+                                       mode=args.mode)
+
+
+def cmd_convert(args):
+    from data_conversion import process_all_osz
+    process_all_osz(args.folder, workers=args.workers, cache_path=args.cache, annotation_store=args.store,
+                    write_text=not args.no_text, io_threads=args.io_threads, md5_names=args.md5_names,
+                    difficulties=args.difficulties, stats_path=args.stats)
+
+
+def cmd_timing_json(args):
+    tool = _import_tool('extract_uninherited_timing_points')
+    tool.process_all_osz_in_folder(args.folder, cache_path=args.cache, io_threads=args.io_threads,
+                                   stats_path=args.stats)
+
+
+def cmd_song_info(args):
+    tool = _import_tool('song_info_csv')
+    tool.process_osz_folder(args.folder, cache_path=args.cache, output_path=args.output, stats_path=args.stats)
+
+
+def cmd_track(args):
+    tool = _import_tool('self_track_madmom')
+    settings = {"audio_folder": args.audio, "output_folder": args.output,
+                "checkpoint_file": args.checkpoint, "activation_cache": args.activations,
+                "audio_cache": args.audio_cache, "audio_cache_max_bytes": _gigabytes(args.audio_cache_gb)}
+    tool.configure(**{name: value for name, value in settings.items() if value is not None})
+    if args.no_activation_cache:
+        tool.configure(activation_cache=None)
+    if args.sweep:
+        tool.sweep_dbn(workers=args.dbn_workers or os.cpu_count() or 1)
+    else:
+        tool.main(rnn_workers=args.rnn_workers or tool.RNN_WORKERS, dbn_workers=args.dbn_workers or tool.DBN_WORKERS,
+                  retry_failed=args.retry_failed, stats_path=args.stats, serial=args.serial)
+
+
+def cmd_evaluate(args):
+    tool = _import_tool('madmom_evaluation')
+    tool.evaluate_folder_f_cmlt_amlt(args.detections, args.labels, args.output, workers=args.workers,
+                                     chunk_size=args.chunk_size, label_store=args.label_store,
+                                     stats_path=args.stats, analysis=not args.no_analysis)
+
+
+def cmd_align(args):
+    tool = _import_tool('alignment_score')
+    cache_options = {"audio_cache": args.audio_cache}
+    if args.audio_cache_gb is not None:
+        cache_options["audio_cache_max_bytes"] = _gigabytes(args.audio_cache_gb)
+    tool.score_folder(args.audio, args.labels, args.output, workers=args.workers, label_store=args.label_store,
+                      stats_path=args.stats, **cache_options)
+
+
+def cmd_export(args):
+    import training_export
+    index_path = args.index or os.path.join(args.folder, 'classification_index.npz')
+    subsets = None
+    if os.path.isfile(index_path):
+        subsets = training_export.subsets_from_index(index_path, min_separation=args.min_separation)
+    training_export.export_shards(args.folder, args.output, shard_bytes=int(args.shard_mb * 1024 ** 2),
+                                  splits=_splits(args.splits), seed=args.seed, subsets=subsets, info_path=args.info,
+                                  label_store=args.label_store, stats_path=args.stats)
+
+
+# ===== Argument parsing =====
+
+def _gigabytes(value):
+    return None if value is None else int(value * 1024 ** 3)
+
+
+def _splits(value):
+    """'train=0.8,val=0.1,test=0.1' → (("train", 0.8), ("val", 0.1), ("test", 0.1))"""
+    splits = []
+    for part in value.split(","):
+        name, _, ratio = part.partition("=")
+        splits.append((name.strip(), float(ratio)))
+    return tuple(splits)
+
+
+def _add_audio_cache_arguments(sub):
+    sub.add_argument("--audio-cache", metavar="DIR", help="decode each track once into this shared PCM cache")
+    sub.add_argument("--audio-cache-gb", type=float, help="evict least recently used entries above this size (default: 20)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="osu2mir dataset tools")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+    cpus = os.cpu_count() or 1
+
+    def command(name, handler, help):
+        sub = commands.add_parser(name, help=help, description=help)
+        sub.set_defaults(handler=handler)
+        sub.add_argument("--stats", metavar="JSON", help="write a per-stage timing summary here")
+        return sub
+
+    sub = command("partition", cmd_partition, "sort .osz files by their uninherited timing points")
+    sub.add_argument("folder", help="folder of .osz files")
+    sub.add_argument("--output", default=".", help="parent folder of the three category folders (default: .)")
+    sub.add_argument("--mode", choices=("move", "symlink", "hardlink", "manifest"), default="move",
+                     help="move the archives, or index once and link them into the categories "
+                          "(manifest: list them in each category's manifest.txt instead)")
+    sub.add_argument("--index", help="classification index path for the other modes (default: FOLDER/classification_index.npz)")
+    sub.add_argument("--min-separation", type=float, default=5000, help="ms between red lines for the geq5 category")
+    sub.add_argument("--cache", help="build cache (.sqlite) to skip archives already scanned")
+
+    sub = command("convert", cmd_convert, "write audio and metered beat annotations for every .osz")
+    sub.add_argument("folder", help="folder of .osz files; outputs go to new_audio/ and metered_beats/ inside it")
+    sub.add_argument("--workers", type=int, default=cpus, help=f"processes (default: {cpus})")
+    sub.add_argument("--io-threads", type=int, default=0, help="audio/.txt writer threads in single-process mode")
+    sub.add_argument("--cache", help="build cache (.sqlite) to skip unchanged archives")
+    sub.add_argument("--store", help="also collect annotations into this annotation store")
+    sub.add_argument("--no-text", action="store_true", help="skip the per-song .txt files (needs --store)")
+    sub.add_argument("--md5-names", action="store_true", help="name outputs <MD5>_<BeatmapSetID>")
+    sub.add_argument("--difficulties", choices=DIFFICULTY_MODES, default="first")
+
+    sub = command("timing-json", cmd_timing_json, "extract uninherited timing points as .json with their audio")
+    sub.add_argument("folder", help="folder of .osz files")
+    sub.add_argument("--io-threads", type=int, default=0, help="audio/.json writer threads")
+    sub.add_argument("--cache", help="build cache (.sqlite) to skip unchanged archives")
+
+    sub = command("song-info", cmd_song_info, "one row of metadata per .osz, as .csv or .parquet")
+    sub.add_argument("folder", help="folder of .osz files")
+    sub.add_argument("--output", help="output table (default: single_timing_song_info.csv)")
+    sub.add_argument("--cache", help="build cache (.sqlite) to skip unchanged archives")
+
+    sub = command("track", cmd_track, "run madmom beat/downbeat tracking over a folder of MP3s")
+    sub.add_argument("--audio", help="folder of .mp3 files (default: ./audio)")
+    sub.add_argument("--output", help="results folder (default: ./madmom_results)")
+    sub.add_argument("--checkpoint", help="status store (default: ./processing_checkpoint.sqlite)")
+    sub.add_argument("--activations", help="RNN activation cache folder (default: ./madmom_activations)")
+    sub.add_argument("--no-activation-cache", action="store_true")
+    sub.add_argument("--rnn-workers", type=int, help="RNN processes, pipelined with DBN decoding (default: 1)")
+    sub.add_argument("--dbn-workers", type=int, help="DBN processes (sweep default: all CPUs)")
+    sub.add_argument("--retry-failed", action="store_true", help="retry files that failed in earlier runs")
+    sub.add_argument("--serial", action="store_true", help="track one file at a time in this process (per-stage timings)")
+    sub.add_argument("--sweep", action="store_true", help="re-decode cached activations with every SWEEP_CONFIGS entry")
+    _add_audio_cache_arguments(sub)
+
+    sub = command("evaluate", cmd_evaluate, "F-measure/CMLt/AMLt of madmom results against the annotations")
+    sub.add_argument("detections", help="folder of <song>_beats.txt / <song>_downbeats.txt")
+    sub.add_argument("labels", help="folder of <song>_beats_metered.txt")
+    sub.add_argument("output", help="results table (.csv or .parquet)")
+    sub.add_argument("--label-store", help="read labels from an annotation store or zip instead")
+    sub.add_argument("--workers", type=int, default=cpus, help=f"processes (default: {cpus})")
+    sub.add_argument("--chunk-size", type=int, default=32, help="songs per worker task")
+    sub.add_argument("--no-analysis", action="store_true", help="skip the extreme-case and metric-level tables")
+
+    sub = command("align", cmd_align, "score each annotation's beat grid against its audio and suggest offset fixes")
+    sub.add_argument("audio", help="folder of <song>.mp3 (e.g. new_audio/ from convert)")
+    sub.add_argument("labels", help="folder of <song>_beats_metered.txt")
+    sub.add_argument("output", help="score table (.csv or .parquet)")
+    sub.add_argument("--label-store", help="read labels from an annotation store or zip instead")
+    sub.add_argument("--workers", type=int, default=cpus, help=f"processes (default: {cpus})")
+    _add_audio_cache_arguments(sub)
+
+    sub = command("export", cmd_export, "pack converted audio and metered beats into indexed training shards")
+    sub.add_argument("folder", help="converted folder with manifest.csv (from convert)")
+    sub.add_argument("output", help="folder for the <split>-NNNNN.tar shards and index.npz")
+    sub.add_argument("--shard-mb", type=float, default=512, help="target shard size in MiB (default: 512)")
+    sub.add_argument("--splits", default="train=0.8,val=0.1,test=0.1", help="split ratios, assigned per BeatmapSetID")
+    sub.add_argument("--seed", type=int, default=0, help="change to draw a different split")
+    sub.add_argument("--index", help="classification index for subset labels (default: FOLDER/classification_index.npz if present)")
+    sub.add_argument("--min-separation", type=float, default=5000, help="ms between red lines for the geq5 category")
+    sub.add_argument("--info", help="song-info table (.csv/.parquet) to copy into each sample's metadata")
+    sub.add_argument("--label-store", help="annotation store or zip for songs converted with --no-text")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,147 +1,464 @@
+import csv
 import os
-import zipfile
-import shutil
-import tempfile
-from mutagen.mp3 import MP3, HeaderNotFoundError
+import re
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from annotation_store import AnnotationStore, AnnotationStoreWriter
+from build_cache import BuildCache, audio_hit, copy_audio_dedup, link_or_copy
+import instrumentation
+from instrumentation import count, instrumented, stage
+from io_pool import IOPool, copy_audio_from_osz, finished
+from mp3_stream import scan_file
+from multi_difficulty import difficulty_report, group_difficulties, timing_agreement
+from osz_archive import OszArchive
+from osu_parser import uninherited_points
 
+DIFFICULTY_MODES = ("first", "consensus", "all")
 
-def get_mp3_duration_safe(file_path):
-    try:
-        audio = MP3(file_path)
-        return audio.info.length * 1000  # milliseconds
-    except HeaderNotFoundError:
-        return None
-
-
-def frange(start, stop, step):
-    while start < stop:
-        yield start
-        start += step
-
-
-def extract_metered_beats_correct(osu_lines, dur_ms):
-    beats_with_meter = []
-
-    # Collect all uninherited timing points
-    timing_points = []
-    reading = False
-    for line in osu_lines:
-        line = line.strip()
-        if line == "[TimingPoints]":
-            reading = True
-            continue
-        if reading:
-            if line.startswith("["):
-                break
-            parts = line.split(",")
-            if len(parts) >= 7:
-                try:
-                    time = float(parts[0])
-                    beat_length = float(parts[1])
-                    meter = int(parts[2])
-                    uninherited = int(parts[6]) == 1
-                    if uninherited:
-                        timing_points.append((time, beat_length, meter))
-                except ValueError:
-                    continue
-
-    # Sort by time to be sure
-    timing_points.sort()
-    timing_points.append((dur_ms, None, None))  # Dummy end
-
-    # Generate metered beats
-    for i in range(len(timing_points) - 1):
-        start_time, beat_len, meter = timing_points[i]
-        end_time = timing_points[i + 1][0]
-
-        beat_index = 1
-        bt = start_time
-        while bt < end_time:
-            if bt >= 0:
-                beats_with_meter.append((bt / 1000, beat_index))  # convert to seconds
-            beat_index = (beat_index % meter) + 1
-            bt += beat_len
-
-    return beats_with_meter
-
-
-def get_audio_filename_from_osu(osu_lines):
-    in_general = False
-    for line in osu_lines:
-        line = line.strip()
-        if line == '[General]':
-            in_general = True
-            continue
-        if in_general:
-            if line.startswith('['):
-                break
-            if line.startswith('AudioFilename:'):
-                return line.split(':', 1)[1].strip()
-    return None
-
-
-def process_osz_file(osz_path, audio_folder, annotation_folder):
+
+def extract_metered_beats_correct(timing_points, dur_ms):
+    """Metered beats from a parsed timing-point array as (times in seconds, positions in bar).
+
+    Each red line contributes beats at start + k * beat_length up to the next red
+    line (or the end of the audio). Beats before 0 ms are dropped but still count
+    towards the bar position.
+    """
+    red = uninherited_points(timing_points)
+    starts = red["time"]
+    ends = np.append(starts[1:], dur_ms)
+    beat_lens = red["beat_length"]
+    meters = np.maximum(red["meter"], 1)  # meter 0 is invalid; treat it as one beat per bar
+
+    # Beats per segment; the +1 absorbs rounding in the division and is masked out below
+    valid = (beat_lens > 0) & (ends > starts)
+    counts = np.zeros(len(red), dtype=np.int64)
+    counts[valid] = np.ceil((ends[valid] - starts[valid]) / beat_lens[valid]).astype(np.int64) + 1
+
+    # Lay every segment's k = 0..count-1 out in one flat array
+    segment = np.repeat(np.arange(len(red)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    beat_times = starts[segment] + k * beat_lens[segment]
+    beat_positions = k % meters[segment] + 1
+
+    keep = (beat_times < ends[segment]) & (beat_times >= 0)
+    return beat_times[keep] / 1000, beat_positions[keep]  # convert to seconds
+
+
+def write_metered_beats(path, beat_times, beat_positions):
+    with stage("write"):
+        np.savetxt(path, np.column_stack((beat_times, beat_positions)), fmt=("%.6f", "%d"), delimiter="\t")
+
+
+def beatmapset_id(beatmap, song_name):
+    """BeatmapSetID from the .osu metadata, else the leading number of the .osz name ("123 Artist - Title")."""
+    set_id = beatmap["metadata"].get("BeatmapSetID", "").strip()
+    if set_id.isdigit():
+        return set_id
+    match = re.match(r"\d+", song_name)
+    return match.group(0) if match else song_name
+
+
+def copy_audio_md5_named(archive, member, audio_folder, set_id, known_audio=None):
+    """Copy an MP3 member to `<MD5>_<BeatmapSetID>.mp3` in one read.
+
+    The member is hashed, frame-counted (mp3_stream) and written in a single
+    pass under a temporary name that is renamed once the MD5 is known.
+    Returns (audio_path, (md5, crc, size), duration in seconds or None).
+    """
+    info = archive.getinfo(member)
+    hit = audio_hit(known_audio, info, check_md5=False)  # the scan below hashes it anyway
+    if hit is not None:
+        md5, duration_s = scan_file(hit[1])
+        if md5 != hit[0]:
+            hit = None
+    if hit is not None:
+        audio_path = os.path.join(audio_folder, f"{md5}_{set_id}.mp3")
+        link_or_copy(hit[1], audio_path)
+    else:
+        partial_path = os.path.join(audio_folder, f".{set_id}_{os.getpid()}.mp3.part")
+        md5, duration_s = archive.copy_mp3(member, partial_path)
+        audio_path = os.path.join(audio_folder, f"{md5}_{set_id}.mp3")
+        os.replace(partial_path, audio_path)
+    return audio_path, (md5, info.CRC, info.file_size), duration_s
+
+
+def process_osz_file(osz_path, audio_folder, annotation_folder, known_audio=None, io=None, md5_names=False,
+                     difficulties="first"):
+    """Convert one .osz into audio + metered beats and return a result dict.
+
+    `known_audio` ({(crc, size): (md5, path)}, see build_cache) lets identical
+    MP3s already converted from another beatmap set be hardlinked instead of copied.
+    With `annotation_folder=None` no .txt is written; the beats are always
+    returned under "beats" for the caller to store.
+    With an `io` pool (io_pool.IOPool) the audio copy and .txt write are only
+    queued: "audio" is then a Future and "jobs" lists what must finish first.
+    With `md5_names`, outputs are named `<MD5>_<BeatmapSetID>` like
+    osu2beat2025_metered_beats.zip, and the audio is hashed, measured and copied
+    in a single read (the duration is then frame-accurate, see mp3_stream).
+    `difficulties` picks the timing: "first" uses the first .osu (as before);
+    "consensus" parses every difficulty, groups identical red lines
+    (multi_difficulty) and uses the timing most difficulties share; "all" also
+    writes each other distinct timing as `<name>_alt<k>_beats_metered.txt`.
+    Both report each difficulty's agreement with the consensus under
+    "difficulty_report".
+    """
+    if difficulties not in DIFFICULTY_MODES:
+        raise ValueError(f"difficulties must be one of {DIFFICULTY_MODES}, got {difficulties!r}")
     song_name = os.path.splitext(os.path.basename(osz_path))[0]
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        with zipfile.ZipFile(osz_path, 'r') as zip_ref:
-            zip_ref.extractall(tmpdir)
+    with stage("unzip"):
+        archive = OszArchive(osz_path)
+        osu_files = archive.osu_names()
 
-        osu_files = [f for f in os.listdir(tmpdir) if f.endswith(".osu")]
+    with archive:
         if not osu_files:
-            print(f"❌ No .osu file found in {song_name}")
-            return
+            return _result(osz_path, False, f"No .osu file found in {song_name}", failure="no_osu")
 
-        osu_path = os.path.join(tmpdir, osu_files[0])
-        with open(osu_path, 'r', encoding='utf-8') as f:
-            osu_lines = f.readlines()
+        with stage("parse"):
+            if difficulties == "first":
+                groups = None
+                beatmap = archive.parse_osu(osu_files[0])
+            else:
+                groups = group_difficulties(archive.parse_all_osu())
+                beatmap = groups[0]["beatmap"]
 
-        target_mp3_name = get_audio_filename_from_osu(osu_lines)
+        target_mp3_name = beatmap["general"].get("AudioFilename")
         if not target_mp3_name:
-            print(f"❌ AudioFilename not found in {song_name}")
-            return
+            return _result(osz_path, False, f"AudioFilename not found in {song_name}",
+                           failure="missing_audio_filename")
 
-        target_mp3_path = os.path.join(tmpdir, target_mp3_name)
-        if not os.path.isfile(target_mp3_path):
-            if os.path.isfile(target_mp3_path.lower()):
-                target_mp3_path = target_mp3_path.lower()
+        target_mp3_member = archive.find_member(target_mp3_name)
+        if target_mp3_member is None:
+            return _result(osz_path, False, f"Expected mp3 file '{target_mp3_name}' not found in {song_name}",
+                           failure="missing_mp3")
+
+        set_id = beatmapset_id(beatmap, song_name)
+        os.makedirs(audio_folder, exist_ok=True)
+        jobs = []
+        if md5_names:
+            # The name depends on the MD5, so this copy can't be deferred to `io`
+            with stage("copy"):
+                audio_path, audio, duration_s = copy_audio_md5_named(archive, target_mp3_member, audio_folder,
+                                                                     set_id, known_audio)
+            output_name = os.path.splitext(os.path.basename(audio_path))[0]
+            if not duration_s:
+                os.remove(audio_path)
+                return _result(osz_path, False, f"No MPEG frames found in '{target_mp3_name}'",
+                               failure="unreadable_duration")
+        else:
+            with stage("duration"):
+                duration_s = archive.mp3_duration(target_mp3_member)
+            if not duration_s:
+                return _result(osz_path, False, f"Unable to read duration of '{target_mp3_name}'",
+                               failure="unreadable_duration")
+            output_name = song_name
+            audio_path = os.path.join(audio_folder, f"{song_name}.mp3")
+            if io is not None:
+                audio = io.submit(copy_audio_from_osz, osz_path, target_mp3_member, audio_path, known_audio)
+                jobs.append(audio)
             else:
-                print(f"❌ Expected mp3 file '{target_mp3_name}' not found in {song_name}")
-                return
+                with stage("copy"):
+                    audio = copy_audio_dedup(archive, target_mp3_member, audio_path, known_audio)
+        duration_ms = duration_s * 1000
 
-        duration_ms = get_mp3_duration_safe(target_mp3_path)
-        if not duration_ms:
-            print(f"❌ Unable to read duration of '{target_mp3_name}'")
-            return
+        # One grid per distinct timing; identical difficulties were already merged by hash
+        timed = [beatmap] if groups is None else [group["beatmap"] for group in groups]
+        with stage("beat_grid"):
+            grids = [extract_metered_beats_correct(b["timing_points"], duration_ms) for b in timed]
+        beat_times, beat_positions = grids[0]
 
-        os.makedirs(audio_folder, exist_ok=True)
-        shutil.copy(target_mp3_path, os.path.join(audio_folder, f"{song_name}.mp3"))
+        extra = {}
+        if groups is not None:
+            extra["difficulty_report"] = difficulty_report(song_name, groups, timing_agreement(grids))
+        alt_beats = {f"{output_name}_alt{k}": grid for k, grid in enumerate(grids) if k > 0} \
+            if difficulties == "all" else {}
 
-        beats_with_meter = extract_metered_beats_correct(osu_lines, duration_ms)
+        outputs = [audio_path]
+        if annotation_folder is not None:
+            os.makedirs(annotation_folder, exist_ok=True)
+            for name, (times, positions) in [(output_name, grids[0]), *alt_beats.items()]:
+                annotation_path = os.path.join(annotation_folder, f"{name}_beats_metered.txt")
+                if io is not None:
+                    jobs.append(io.submit(write_metered_beats, annotation_path, times, positions))
+                else:
+                    write_metered_beats(annotation_path, times, positions)
+                outputs.append(annotation_path)
+
+        if io is not None:
+            extra["jobs"] = jobs
+        return _result(osz_path, True, f"Processed {song_name}",
+                       outputs=outputs, audio=audio, beats=(beat_times, beat_positions), alt_beats=alt_beats,
+                       output_name=output_name, beatmapset_id=set_id, duration=duration_s, **extra)
+
+
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_FIELDS = ("song_name", "beatmapset_id", "md5", "duration_seconds", "audio", "annotation")
+DIFFICULTY_REPORT_NAME = "difficulty_report.csv"
+DIFFICULTY_REPORT_FIELDS = ("song_name", "osu_file", "version", "timing_hash", "group", "num_red_lines",
+                            "beat_agreement", "downbeat_agreement")
+
+
+def _manifest_row(folder_path, result):
+    outputs = [os.path.relpath(path, folder_path) for path in result["outputs"]]
+    return {"song_name": result["song_name"], "beatmapset_id": result["beatmapset_id"],
+            "md5": result["audio"][0], "duration_seconds": result["duration"],
+            "audio": outputs[0], "annotation": outputs[1] if len(outputs) > 1 else ""}
+
+
+def update_manifest(manifest_path, rows):
+    """Merge `rows` into the manifest CSV by song_name, keeping rows of beatmaps not converted this run."""
+    if not rows:
+        return
+    merged = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, newline='', encoding='utf-8') as f:
+            merged = {row["song_name"]: row for row in csv.DictReader(f)}
+    merged.update((row["song_name"], row) for row in rows)
+    with open(manifest_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        writer.writerows(merged[name] for name in sorted(merged))
+
+
+def update_difficulty_report(report_path, rows, song_names):
+    """Merge `rows` into the difficulty report by (song_name, osu_file).
+
+    Songs in `song_names` were converted this run and get only their new rows,
+    so a difficulty removed from a re-converted archive drops out.
+    """
+    if not song_names:
+        return
+    merged = {}
+    if os.path.isfile(report_path):
+        with open(report_path, newline='', encoding='utf-8') as f:
+            merged = {(row["song_name"], row["osu_file"]): row for row in csv.DictReader(f)
+                      if row["song_name"] not in song_names}
+    merged.update(((row["song_name"], row["osu_file"]), row) for row in rows)
+    with open(report_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=DIFFICULTY_REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(merged[key] for key in sorted(merged))
 
-        os.makedirs(annotation_folder, exist_ok=True)
-        with open(os.path.join(annotation_folder, f"{song_name}_beats_metered.txt"), 'w') as bf:
-            for b, m in beats_with_meter:
-                bf.write(f"{b:.6f}\t{m}\n")
 
-        print(f"✅ Processed {song_name}")
+def _result(osz_path, ok, message, **extra):
+    song_name = os.path.splitext(os.path.basename(osz_path))[0]
+    return {"osz_path": osz_path, "song_name": song_name, "ok": ok, "message": message, **extra}
+
+
+_worker_known_audio = None
+_worker_instrumented = False
+
+
+def _init_worker(known_audio, instrumentation_options=None):
+    global _worker_known_audio, _worker_instrumented
+    _worker_known_audio = known_audio
+    if instrumentation_options is not None:
+        instrumentation.activate(instrumentation_options)
+        _worker_instrumented = True
+
+
+def _process_osz_safe(osz_path, audio_folder, annotation_folder, known_audio=None, io=None, md5_names=False,
+                      difficulties="first"):
+    """Worker entry point: never raises, so one bad archive can't kill the pool."""
+    if known_audio is None:
+        known_audio = _worker_known_audio
+    try:
+        with instrumentation.track_file(os.path.basename(osz_path)):
+            result = process_osz_file(osz_path, audio_folder, annotation_folder, known_audio, io, md5_names,
+                                      difficulties)
+    except Exception as e:
+        result = _result(osz_path, False, f"Error processing {os.path.basename(osz_path)}: {e}", failure="error")
+    if _worker_instrumented:
+        # Pool worker: ship this file's timings back to the parent's run
+        result["instrumentation"] = instrumentation.current().drain()
+    return result
+
+
+def _iter_results_parallel(osz_paths, audio_folder, annotation_folder, workers, max_in_flight, ordered,
+                           known_audio=None, md5_names=False, difficulties="first"):
+    """Fan archives out over a process pool with at most `max_in_flight` pending tasks."""
+    pending = deque()
+    paths = iter(osz_paths)
+    run = instrumentation.current()
+    initargs = (known_audio, run.options if run is not None else None)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        def submit_next():
+            for path in paths:
+                pending.append(pool.submit(_process_osz_safe, path, audio_folder, annotation_folder,
+                                           md5_names=md5_names, difficulties=difficulties))
+                return True
+            return False
+
+        while len(pending) < max_in_flight and submit_next():
+            pass
+
+        while pending:
+            if ordered:
+                # Yield strictly in submission order
+                yield pending.popleft().result()
+                submit_next()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield future.result()
+                    submit_next()
+
+
+def process_all_osz(folder_path, workers=1, max_in_flight=None, ordered=False, verbose=True, cache_path=None,
+                    annotation_store=None, write_text=True, io_threads=0, md5_names=False, difficulties="first",
+                    stats_path=None):
+    """Convert every .osz in `folder_path` and return a summary of successes and failures.
+
+    workers > 1 fans `process_osz_file` out over a process pool; `max_in_flight`
+    bounds how many archives are queued at once (default 4 per worker) and
+    `ordered` returns results in directory-listing order instead of completion order.
+    With `cache_path`, archives unchanged since the last run (and whose outputs
+    still exist) are skipped and duplicate audio is hardlinked (see build_cache).
+    An archive is only skipped if that run also wrote what this one asks for:
+    its .txt files when `write_text`, and its keys in `annotation_store`.
+    With `annotation_store`, beats are also collected into one annotation_store
+    file; `write_text=False` then skips the per-song .txt files entirely.
+    `io_threads` > 0 (single-process mode) moves audio copies and .txt writes to
+    a bounded thread pool so they overlap with parsing the next archives; a
+    process pool already overlaps them across workers.
+    `md5_names=True` names outputs `<MD5>_<BeatmapSetID>` (see process_osz_file).
+    Every converted beatmap's MD5 and duration are kept in manifest.csv.
+    `difficulties="consensus"` or `"all"` (see process_osz_file) also writes
+    difficulty_report.csv with the timing agreement of every difficulty, merged
+    like the manifest.
+    `stats_path` writes a JSON summary of per-stage times, failure counts and the
+    slowest archives (see instrumentation); an enclosing `instrumented(...)` run
+    is used otherwise.
+    """
+    with instrumented("conversion", stats_path):
+        return _convert_folder(folder_path, workers, max_in_flight, ordered, verbose, cache_path,
+                               annotation_store, write_text, io_threads, md5_names, difficulties)
 
 
-def process_all_osz(folder_path):
+def _stored_keys(store_path):
+    """Keys already in the annotation store at `store_path` (empty if there is none yet)."""
+    try:
+        return set(AnnotationStore(store_path))
+    except FileNotFoundError:
+        return set()
+
+
+def _covers_run(entry, write_text, stored_keys):
+    """Whether a fresh cache entry produced every output this run asks for.
+
+    Entries recorded without a payload predate it and are converted again.
+    """
+    if entry is None or entry["payload"] is None:
+        return False
+    if write_text and not entry["payload"]["text"]:
+        return False
+    return stored_keys is None or stored_keys.issuperset(entry["payload"]["store_keys"])
+
+
+def _convert_folder(folder_path, workers, max_in_flight, ordered, verbose, cache_path,
+                    annotation_store, write_text, io_threads, md5_names, difficulties):
     audio_folder = os.path.join(folder_path, 'new_audio')
-    annotation_folder = os.path.join(folder_path, 'metered_beats')
+    annotation_folder = os.path.join(folder_path, 'metered_beats') if write_text else None
     os.makedirs(audio_folder, exist_ok=True)
-    os.makedirs(annotation_folder, exist_ok=True)
+    if annotation_folder:
+        os.makedirs(annotation_folder, exist_ok=True)
+
+    osz_paths = [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path)) if f.endswith('.osz')]
+
+    summary = {"total": 0, "succeeded": [], "failed": {}, "skipped": []}
+    cache = BuildCache(cache_path) if cache_path else None
+    known_audio = None
+    cache_stage = "convert_md5" if md5_names else "convert"
+    if difficulties != "first":
+        cache_stage += f"_{difficulties}"
+    if cache is not None:
+        known_audio = cache.known_audio()
+        stored_keys = _stored_keys(annotation_store) if annotation_store else None
+        stale = []
+        for path in osz_paths:
+            if _covers_run(cache.lookup(cache_stage, path), write_text, stored_keys):
+                summary["skipped"].append(os.path.splitext(os.path.basename(path))[0])
+            else:
+                stale.append(path)
+        osz_paths = stale
+
+    io = IOPool(io_threads) if io_threads > 0 and workers <= 1 else None
+    if workers > 1:
+        results = _iter_results_parallel(osz_paths, audio_folder, annotation_folder,
+                                         workers, max_in_flight or 4 * workers, ordered, known_audio,
+                                         md5_names, difficulties)
+    else:
+        results = (_process_osz_safe(p, audio_folder, annotation_folder, known_audio, io, md5_names, difficulties)
+                   for p in osz_paths)
+
+    store = AnnotationStoreWriter(annotation_store) if annotation_store else None
+
+    run = instrumentation.current()
+
+    def finalize(result, error=None):
+        summary["total"] += 1
+        worker_stats = result.pop("instrumentation", None)
+        if worker_stats is not None and run is not None:
+            run.merge(worker_stats)
+        if error is not None:
+            result.update(ok=False, message=f"Error writing {result['song_name']}: {error}", failure="write_error")
+        elif isinstance(result.get("audio"), Future):
+            result["audio"] = result["audio"].result()
+        if result["ok"]:
+            summary["succeeded"].append(result["song_name"])
+            if store is not None:
+                store.add(result["output_name"], *result["beats"])
+                for name, grid in result["alt_beats"].items():
+                    store.add(name, *grid)
+            if cache is not None:
+                md5, crc, size = result["audio"]
+                outputs = result["outputs"] + ([store.data_path] if store is not None else [])
+                cache.record_audio(md5, crc, size, result["outputs"][0])
+                known_audio.setdefault((crc, size), (md5, os.path.abspath(result["outputs"][0])))
+                payload = {"text": write_text, "store_keys": [result["output_name"], *result["alt_beats"]]}
+                cache.record(cache_stage, result["osz_path"], outputs, audio_md5=md5, payload=payload)
+            manifest_rows.append(_manifest_row(folder_path, result))
+            report_rows.extend(result.get("difficulty_report", ()))
+        else:
+            summary["failed"][result["song_name"]] = result["message"]
+            count(result.get("failure", "error"))
+        if verbose:
+            print(f"{'✅' if result['ok'] else '❌'} {result['message']}")
+
+    manifest_rows = []
+    report_rows = []
+    # Results whose background I/O is still running, finalized in order as it completes
+    pending = deque()
+    try:
+        for result in results:
+            pending.append((result, result.pop("jobs", [])))
+            for done, error in finished(pending):
+                finalize(done, error)
+        for done, error in finished(pending, wait=True):
+            finalize(done, error)
+    finally:
+        if io is not None:
+            io.close()
+        update_manifest(os.path.join(folder_path, MANIFEST_NAME), manifest_rows)
+        if difficulties != "first":
+            update_difficulty_report(os.path.join(folder_path, DIFFICULTY_REPORT_NAME), report_rows,
+                                     {row["song_name"] for row in manifest_rows})
+        if store is not None:
+            store.close()
+        if cache is not None:
+            cache.close()
 
-    for file in os.listdir(folder_path):
-        if file.endswith('.osz'):
-            try:
-                process_osz_file(os.path.join(folder_path, file), audio_folder, annotation_folder)
-            except Exception as e:
-                print(f"⚠️ Error processing {file}: {e}")
+    print(f"🎵 Converted {len(summary['succeeded'])}/{summary['total']} beatmaps "
+          f"({len(summary['failed'])} failed, {len(summary['skipped'])} unchanged)")
+    return summary
 
 
 # === MAIN ===
 if __name__ == "__main__":
     input_folder = './osz_folder'  # ← replace with your folder path
-    process_all_osz(input_folder)
+    process_all_osz(input_folder, workers=os.cpu_count() or 1,
+                    cache_path=os.path.join(input_folder, 'build_cache.sqlite'),
+                    stats_path=os.path.join(input_folder, 'conversion_stats.json'))
@@ -1,31 +1,19 @@
+import io
 import os
 import shutil
 import zipfile
+import numpy as np
+from build_cache import BuildCache
+import instrumentation
+from instrumentation import count, instrumented, stage
+from osz_archive import OszArchive
+from osu_parser import parse_osu, uninherited_points
 
 
 def parse_osu_timing_points(osu_file_obj):
-    """Extract uninherited timing points from an open .osu file-like object."""
-    lines = osu_file_obj.read().decode('utf-8').splitlines()
-
-    timing_section = False
-    uninherited_timing_points = []
-
-    for line in lines:
-        line = line.strip()
-        if line == "[TimingPoints]":
-            timing_section = True
-            continue
-        if timing_section:
-            if line == "" or line.startswith("["):
-                break  # End of the Timing Points section
-            parts = line.split(",")
-            if len(parts) > 6:
-                time_position = float(parts[0])  # Timestamp of the timing point
-                uninherited = int(parts[6])  # 1 = uninherited, 0 = inherited
-                if uninherited == 1:
-                    uninherited_timing_points.append(time_position)
-
-    return uninherited_timing_points
+    """Extract uninherited timing point times from an open binary .osu file-like object."""
+    beatmap = parse_osu(io.TextIOWrapper(osu_file_obj, encoding='utf-8'))
+    return uninherited_points(beatmap["timing_points"])["time"].tolist()
 
 
 def classify_timing_points(timing_points, min_separation=5000):
@@ -40,54 +28,240 @@ def classify_timing_points(timing_points, min_separation=5000):
     return 'multiple_timings_5s_or_more_apart'
 
 
-def process_beatmaps(osz_folder, output_folder_single, output_folder_5s_or_more_apart, output_folder_less_than_5s_apart):
-    os.makedirs(output_folder_single, exist_ok=True)
-    os.makedirs(output_folder_5s_or_more_apart, exist_ok=True)
-    os.makedirs(output_folder_less_than_5s_apart, exist_ok=True)
+def process_beatmaps(osz_folder, output_folder_single, output_folder_5s_or_more_apart, output_folder_less_than_5s_apart,
+                     cache_path=None, stats_path=None, min_separation=5000):
+    """Move each .osz into the folder for its timing-point category.
+
+    Songs with red lines less than `min_separation` ms apart go to the "less
+    than" folder (named for the 5000 ms default). With `cache_path`, the uninherited timing points of every archive are kept
+    in a build_cache manifest keyed by file name, so an unchanged .osz seen again
+    is classified without reopening it. `stats_path` writes per-stage timings and
+    failure counts as JSON (see instrumentation).
+    """
+    with instrumented("partition", stats_path):
+        os.makedirs(output_folder_single, exist_ok=True)
+        os.makedirs(output_folder_5s_or_more_apart, exist_ok=True)
+        os.makedirs(output_folder_less_than_5s_apart, exist_ok=True)
+        cache = BuildCache(cache_path) if cache_path else None
+
+        for filename in os.listdir(osz_folder):
+            if not filename.endswith(".osz"):
+                continue
+
+            osz_path = os.path.join(osz_folder, filename)
+
+            try:
+                cached = cache.lookup("partition", osz_path, key=filename) if cache else None
+                if cached is not None:
+                    timing_points = cached["payload"]
+                else:
+                    with instrumentation.track_file(filename):
+                        with stage("unzip"):
+                            zip_ref = zipfile.ZipFile(osz_path, 'r')
+                            osu_filenames = [f for f in zip_ref.namelist() if f.endswith(".osu")]
+                        with zip_ref:
+                            if not osu_filenames:
+                                print(f"⚠️ No .osu file found in {filename}")
+                                count("no_osu")
+                                continue
+
+                            # Just use the first .osu file found
+                            with stage("parse"), zip_ref.open(osu_filenames[0]) as osu_file:
+                                timing_points = parse_osu_timing_points(osu_file)
+                    if cache:
+                        cache.record("partition", osz_path, payload=timing_points, key=filename)
+
+                # Classify the song into one of the three categories
+                category = classify_timing_points(timing_points, min_separation)
+
+                if category == 'single_timing_point':
+                    dest_folder = os.path.join(output_folder_single)
+                    print(f"{filename} → Single uninherited timing point")
+                elif category == 'multiple_timings_less_than_5s':
+                    dest_folder = os.path.join(output_folder_less_than_5s_apart)
+                    print(f"{filename} → Multiple uninherited timing points, < {min_separation / 1000:g}s apart")
+                else:
+                    dest_folder = os.path.join(output_folder_5s_or_more_apart)
+                    print(f"{filename} → Multiple uninherited timing points, ≥ {min_separation / 1000:g}s apart")
+
+                os.makedirs(dest_folder, exist_ok=True)
+                with stage("move"):
+                    shutil.move(osz_path, os.path.join(dest_folder, filename))
+
+            except Exception as e:
+                print(f"❗ Error processing {filename}: {e}")
+                count("error")
+
+        if cache:
+            cache.close()
+        print("🎵 Sorting complete!")
+
+
+CATEGORIES = ('single_timing_point', 'multiple_timings_5s_or_more_apart', 'multiple_timings_less_than_5s')
 
-    for filename in os.listdir(osz_folder):
-        if not filename.endswith(".osz"):
-            continue
 
-        osz_path = os.path.join(osz_folder, filename)
+def build_classification_index(osz_folder, index_path, cache_path=None, stats_path=None):
+    """Scan every .osz once and write a columnar .npz index of its red-line statistics.
 
-        try:
-            with zipfile.ZipFile(osz_path, 'r') as zip_ref:
-                osu_filenames = [f for f in zip_ref.namelist() if f.endswith(".osu")]
-                if not osu_filenames:
-                    print(f"⚠️ No .osu file found in {filename}")
+    Columns: filename, num_uninherited, min_gap / max_gap (ms between consecutive
+    red lines, NaN with fewer than two), timing_span (first to last red line, ms)
+    and mp3_duration (s, NaN if unreadable). Nothing is moved; see
+    classify_index and materialize_subsets. `stats_path` as in process_beatmaps.
+    """
+    with instrumented("partition_index", stats_path):
+        cache = BuildCache(cache_path) if cache_path else None
+        rows = []
+
+        for filename in sorted(os.listdir(osz_folder)):
+            if not filename.endswith(".osz"):
+                continue
+            osz_path = os.path.join(osz_folder, filename)
+
+            try:
+                cached = cache.lookup("partition_index", osz_path) if cache else None
+                if cached is not None:
+                    rows.append(cached["payload"])
                     continue
 
-                # Just use the first .osu file found
-                with zip_ref.open(osu_filenames[0]) as osu_file:
-                    timing_points = parse_osu_timing_points(osu_file)
+                with instrumentation.track_file(filename):
+                    with stage("unzip"):
+                        archive = OszArchive(osz_path)
+                        osu_filenames = archive.osu_names()
+                    with archive:
+                        if not osu_filenames:
+                            print(f"⚠️ No .osu file found in {filename}")
+                            count("no_osu")
+                            continue
+                        with stage("parse"):
+                            beatmap = archive.parse_osu(osu_filenames[0])
+                        mp3_member = archive.find_member(beatmap["general"].get("AudioFilename", ""))
+                        if mp3_member is None:
+                            count("missing_mp3")
+                        with stage("duration"):
+                            mp3_duration = archive.mp3_duration(mp3_member) if mp3_member else None
+                        if mp3_member and not mp3_duration:
+                            count("unreadable_duration")
+
+                row = classification_index_row(filename, beatmap["timing_points"], mp3_duration)
+                if cache:
+                    cache.record("partition_index", osz_path, payload=row)
+                rows.append(row)
+
+            except Exception as e:
+                print(f"❗ Error processing {filename}: {e}")
+                count("error")
+
+        if cache:
+            cache.close()
+
+        save_classification_index(index_path, osz_folder, rows)
+
+
+def classification_index_row(filename, timing_points, mp3_duration):
+    """One index row from a parsed timing-point array and the MP3 duration in seconds (or None)."""
+    times = uninherited_points(timing_points)["time"]
+    gaps = np.diff(times)
+    return [
+        filename,
+        len(times),
+        float(gaps.min()) if len(gaps) else float("nan"),
+        float(gaps.max()) if len(gaps) else float("nan"),
+        float(times[-1] - times[0]) if len(times) else float("nan"),
+        mp3_duration if mp3_duration else float("nan"),
+    ]
 
-            # Classify the song into one of the three categories
-            category = classify_timing_points(timing_points)
 
-            if category == 'single_timing_point':
-                dest_folder = os.path.join(output_folder_single)
-                print(f"{filename} → Single uninherited timing point")
-            elif category == 'multiple_timings_less_than_5s':
-                dest_folder = os.path.join(output_folder_less_than_5s_apart)
-                print(f"{filename} → Multiple uninherited timing points, < 5s apart")
-            else:
-                dest_folder = os.path.join(output_folder_5s_or_more_apart)
-                print(f"{filename} → Multiple uninherited timing points, ≥ 5s apart")
+def save_classification_index(index_path, osz_folder, rows):
+    files, num_uninherited, min_gap, max_gap, timing_span, mp3_duration = zip(*rows) if rows else ([],) * 6
+    np.savez(
+        index_path,
+        osz_folder=np.array(os.path.abspath(osz_folder)),
+        filename=np.array(files, dtype=str),
+        num_uninherited=np.array(num_uninherited, dtype=np.int32),
+        min_gap=np.array(min_gap, dtype=np.float64),
+        max_gap=np.array(max_gap, dtype=np.float64),
+        timing_span=np.array(timing_span, dtype=np.float64),
+        mp3_duration=np.array(mp3_duration, dtype=np.float64),
+    )
+    print(f"🎵 Indexed {len(rows)} beatmaps → {index_path}")
 
-            os.makedirs(dest_folder, exist_ok=True)
-            shutil.move(osz_path, os.path.join(dest_folder, filename))
 
-        except Exception as e:
-            print(f"❗ Error processing {filename}: {e}")
+def load_classification_index(index_path):
+    with np.load(index_path) as data:
+        return {key: data[key] for key in data.files}
 
-    print("🎵 Sorting complete!")
+
+def classify_index(index, min_separation=5000):
+    """Vectorized classify_timing_points over a whole index; returns an array of category names."""
+    n = index["num_uninherited"]
+    with np.errstate(invalid='ignore'):
+        too_close = index["min_gap"] < min_separation  # NaN (fewer than two red lines) compares False
+    return np.where(n == 1, CATEGORIES[0], np.where(too_close, CATEGORIES[2], CATEGORIES[1]))
+
+
+def materialize_subsets(index, categories, output_folders, mode='symlink'):
+    """Expose each category as a folder without touching the original .osz files.
+
+    `output_folders` maps category name → folder. mode='symlink' or 'hardlink'
+    fills the folder with links; mode='manifest' writes <folder>/manifest.txt
+    listing the absolute .osz paths instead. Links and manifests left by an
+    earlier call (another threshold or mode) that no longer apply are removed,
+    so the folders always reflect this classification only.
+    """
+    if mode not in ('symlink', 'hardlink', 'manifest'):
+        raise ValueError(f"Unknown materialize mode: {mode}")
+    osz_folder = str(index["osz_folder"])
+    for category, folder in output_folders.items():
+        os.makedirs(folder, exist_ok=True)
+        members = [os.path.join(osz_folder, f) for f in index["filename"][categories == category]]
+        _remove_stale_links(folder, osz_folder, set() if mode == 'manifest' else set(map(os.path.basename, members)))
+        manifest_path = os.path.join(folder, "manifest.txt")
+        if mode != 'manifest' and os.path.isfile(manifest_path):
+            os.remove(manifest_path)
+
+        if mode == 'manifest':
+            with open(os.path.join(folder, "manifest.txt"), 'w', encoding='utf-8') as f:
+                f.writelines(path + "\n" for path in members)
+        else:
+            for src in members:
+                dest = os.path.join(folder, os.path.basename(src))
+                if os.path.lexists(dest):
+                    os.remove(dest)
+                if mode == 'symlink':
+                    os.symlink(src, dest)
+                else:
+                    os.link(src, dest)
+        print(f"{category} → {len(members)} beatmaps in {folder}")
+
+
+def _remove_stale_links(folder, osz_folder, keep):
+    """Delete links to archives in `osz_folder` (symlinks into it, or hardlinks of its files) not named in `keep`."""
+    for entry in os.scandir(folder):
+        if entry.name in keep or not entry.name.endswith(".osz"):
+            continue
+        if entry.is_symlink():
+            ours = os.path.dirname(os.path.abspath(os.path.join(folder, os.readlink(entry.path)))) == os.path.abspath(osz_folder)
+        else:
+            source = os.path.join(osz_folder, entry.name)
+            ours = os.path.isfile(source) and os.path.samefile(entry.path, source)
+        if ours:
+            os.remove(entry.path)
 
 
 # Example usage
-osu_folder = "./osz_folder"  # Folder containing .osz files
-output_folder_single = "./single_timing_point"  # Destination for songs with a single uninherited timing point
-output_folder_5s_or_more_apart = "./timing_5s_or_more_apart"  # Destination for songs with timings ≥ 5s apart
-output_folder_less_than_5s_apart = "./timing_less_than_5s_apart"  # Destination for songs with timings < 5s apart
+if __name__ == "__main__":
+    osu_folder = "./osz_folder"  # Folder containing .osz files
+    output_folder_single = "./single_timing_point"  # Destination for songs with a single uninherited timing point
+    output_folder_5s_or_more_apart = "./timing_5s_or_more_apart"  # Destination for songs with timings ≥ 5s apart
+    output_folder_less_than_5s_apart = "./timing_less_than_5s_apart"  # Destination for songs with timings < 5s apart
+    move_files = True  # False: index once and symlink the subsets, leaving osz_folder untouched
 
-process_beatmaps(osu_folder, output_folder_single, output_folder_5s_or_more_apart, output_folder_less_than_5s_apart)
+    if move_files:
+        process_beatmaps(osu_folder, output_folder_single, output_folder_5s_or_more_apart, output_folder_less_than_5s_apart)
+    else:
+        index_path = "./classification_index.npz"
+        build_classification_index(osu_folder, index_path)
+        index = load_classification_index(index_path)
+        categories = classify_index(index, min_separation=5000)
+        materialize_subsets(index, categories, dict(zip(CATEGORIES, (
+            output_folder_single, output_folder_5s_or_more_apart, output_folder_less_than_5s_apart))))
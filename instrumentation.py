@@ -0,0 +1,205 @@
+"""Per-stage timers, failure counters and slow-file profiling shared by the scripts.
+
+The scripts call the module-level helpers unconditionally:
+
+    with stage("parse"):
+        beatmap = archive.parse_osu(name)
+    count("missing_mp3")
+
+They are no-ops (a shared nullcontext) unless a run is active, so the cost
+without instrumentation is one global lookup. A run is started with
+
+    with instrumented("conversion", "stats.json", slowest=10, profile=True):
+        process_all_osz(folder)
+
+or by passing `stats_path=...` to the scripts' top-level functions. At the end
+a JSON summary is written: wall time, total/mean time per stage, failure
+counts by category, and the N slowest files, optionally with a cProfile
+excerpt (`profile=True`) and tracemalloc peak (`trace_memory=True`) for each.
+
+Process pools: workers call `activate(options)` in their initializer and
+send `drain()` back with each result; the parent `merge`s it.
+"""
+import cProfile
+import heapq
+import io
+import itertools
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+_NULL = nullcontext()
+_active = None
+
+
+class Instrumentation:
+    def __init__(self, name="run", slowest=10, profile=False, trace_memory=False):
+        self.name = name
+        self.options = {"slowest": slowest, "profile": profile, "trace_memory": trace_memory}
+        self.started = time.perf_counter()
+        self.files = 0
+        self.stages = {}  # name -> [seconds, calls]
+        self.failures = Counter()
+        self._slowest = []  # min-heap of (seconds, seq, record)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_stage(name, time.perf_counter() - started)
+
+    def _add_stage(self, name, seconds, calls=1):
+        with self._lock:
+            total = self.stages.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += calls
+
+    def count(self, category, n=1):
+        if category:
+            with self._lock:
+                self.failures[category] += n
+
+    @contextmanager
+    def track_file(self, name):
+        """Time one input file; the slowest N are kept, with a profile / memory peak if enabled."""
+        profiler = cProfile.Profile() if self.options["profile"] else None
+        if self.options["trace_memory"]:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record = {"file": name, "seconds": time.perf_counter() - started}
+            if self.options["trace_memory"]:
+                record["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            self._record(record, profiler)
+
+    def record_file(self, name, seconds):
+        """Count a file timed elsewhere, e.g. a track finished by a pool worker."""
+        self._record({"file": name, "seconds": seconds})
+
+    def record_stage(self, name, seconds):
+        """Add one call of a stage timed elsewhere, e.g. in a pool worker."""
+        self._add_stage(name, seconds)
+
+    def _record(self, record, profiler=None):
+        with self._lock:
+            self.files += 1
+        self._keep_if_slow(record, profiler)
+
+    def _keep_if_slow(self, record, profiler=None):
+        limit = self.options["slowest"]
+        with self._lock:
+            if len(self._slowest) >= limit and record["seconds"] <= self._slowest[0][0]:
+                return
+            if profiler is not None:
+                record["profile"] = _profile_excerpt(profiler)
+            entry = (record["seconds"], next(self._seq), record)
+            if len(self._slowest) < limit:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heapreplace(self._slowest, entry)
+
+    def drain(self):
+        """Everything recorded since the last drain, as a picklable dict, then reset."""
+        with self._lock:
+            snapshot = {"files": self.files, "stages": self.stages, "failures": dict(self.failures),
+                        "slowest": [entry[2] for entry in self._slowest]}
+            self.files, self.stages, self.failures, self._slowest = 0, {}, Counter(), []
+        return snapshot
+
+    def merge(self, snapshot):
+        for name, (seconds, calls) in snapshot["stages"].items():
+            self._add_stage(name, seconds, calls)
+        with self._lock:
+            self.files += snapshot["files"]
+            self.failures.update(snapshot["failures"])
+        for record in snapshot["slowest"]:
+            self._keep_if_slow(record)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "wall_seconds": time.perf_counter() - self.started,
+                "files": self.files,
+                "stages": {name: {"seconds": seconds, "calls": calls, "mean_ms": 1000 * seconds / calls}
+                           for name, (seconds, calls) in sorted(self.stages.items(), key=lambda s: -s[1][0])},
+                "failures": dict(self.failures.most_common()),
+                "slowest": [entry[2] for entry in sorted(self._slowest, reverse=True)],
+            }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def _profile_excerpt(profiler, lines=15):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(lines)
+    return stream.getvalue()
+
+
+# ===== Module-level helpers used by the scripts =====
+
+def current():
+    """The active Instrumentation, or None."""
+    return _active
+
+
+def stage(name):
+    return _active.stage(name) if _active is not None else _NULL
+
+
+def count(category, n=1):
+    if _active is not None:
+        _active.count(category, n)
+
+
+def track_file(name):
+    return _active.track_file(name) if _active is not None else _NULL
+
+
+def activate(options=None, name="worker"):
+    """Start recording in this process (e.g. a pool worker); `options` as in Instrumentation.options."""
+    global _active
+    _active = Instrumentation(name, **(options or {}))
+    return _active
+
+
+@contextmanager
+def instrumented(name, json_path=None, **options):
+    """Record a run and write its JSON summary to `json_path`.
+
+    Without `json_path` (and no options) this joins an already active run, or
+    does nothing, so top-level functions can always wrap themselves in it.
+    """
+    global _active
+    if json_path is None and not options:
+        yield _active
+        return
+    previous, _active = _active, Instrumentation(name, **options)
+    try:
+        yield _active
+    finally:
+        run, _active = _active, previous
+        if json_path:
+            run.write_json(json_path)
+            summary = run.summary()
+            stages = ", ".join(f"{n} {s['seconds']:.2f}s" for n, s in list(summary["stages"].items())[:5])
+            stages = f" ({stages})" if stages else ""
+            print(f"⏱️ {summary['files']} files in {summary['wall_seconds']:.2f}s{stages} → {json_path}")
@@ -0,0 +1,67 @@
+"""Bounded background I/O so MP3 copies and output writes overlap with parsing.
+
+On network storage the scripts spend most of their wall time in `copy_member`
+and small file writes while the CPU sits idle. `IOPool` runs those jobs on a
+few threads (zipfile, hashlib and file writes release the GIL) and blocks
+`submit` once `max_pending` jobs are queued, so a fast parser can't buffer
+unbounded audio ahead of a slow disk.
+
+Callers keep the returned futures next to their result and finalize results in
+order with `finished`, once every job a result depends on is done.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from build_cache import copy_audio_dedup
+from instrumentation import stage
+from osz_archive import OszArchive
+
+DEFAULT_IO_THREADS = 4
+
+
+class IOPool:
+    def __init__(self, max_workers=DEFAULT_IO_THREADS, max_pending=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="io")
+        self._slots = threading.BoundedSemaphore(max_pending or 4 * max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)`; blocks while `max_pending` jobs are outstanding."""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+def copy_audio_from_osz(osz_path, member, dest_path, known_audio=None):
+    """copy_audio_dedup on a private handle, so the job doesn't depend on the caller's open archive."""
+    with stage("copy"), OszArchive(osz_path) as archive:
+        return copy_audio_dedup(archive, member, dest_path, known_audio)
+
+
+def finished(pending, wait=False):
+    """Pop and yield `(payload, error)` from the front of `pending` while its jobs are done.
+
+    `pending` is a deque of `(payload, futures)`; order is preserved, so a slow
+    job holds back later payloads. `error` is the first job exception or None.
+    With `wait=True` every entry is drained, blocking as needed.
+    """
+    while pending and (wait or all(f.done() for f in pending[0][1])):
+        payload, futures = pending.popleft()
+        error = None
+        for future in futures:
+            exc = future.exception()
+            if exc is not None and error is None:
+                error = exc
+        yield payload, error
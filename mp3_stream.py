@@ -0,0 +1,218 @@
+"""MD5 and frame-accurate MP3 duration from a single streaming read.
+
+`Mp3Stream` is fed the raw bytes of an MP3 as they are copied and walks the
+MPEG frame headers on the fly, so hashing, measuring and writing the audio
+cost one read of the data:
+
+- ID3v2 tags at the start and junk/trailing tags (ID3v1, APE) are skipped by
+  re-syncing, which only accepts a header that is followed by another one.
+- A Xing/Info or VBRI header in the first frame is not counted as audio; the
+  LAME encoder delay and padding it carries are trimmed, as mutagen does.
+- Every other frame contributes its own sample count, so VBR files and files
+  without a Xing header get their exact length instead of a size/bitrate
+  estimate, and files mutagen rejects with HeaderNotFoundError still get a
+  duration whenever they contain valid frames.
+"""
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# kbit/s by (version, layer); index 0 ("free") and 15 are rejected
+_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_BITRATES[(2, 3)] = _BITRATES[(2, 2)]
+_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+_VERSIONS = (2.5, None, 2, 1)
+_MONO = 3
+
+_LAME_VERSION = re.compile(rb"(?:LAME|L)(\d)\.(\d+)")
+
+
+def parse_frame_header(buf, i):
+    """(frame_length, samples, sample_rate, version, mode, layer) of the header at buf[i], or None."""
+    if buf[i] != 0xFF or buf[i + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = buf[i + 1], buf[i + 2], buf[i + 3]
+    version = _VERSIONS[(b1 >> 3) & 3]
+    layer = 4 - ((b1 >> 1) & 3)
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+    if version is None or layer == 4 or rate_index == 3 or bitrate_index in (0, 15):
+        return None
+    bitrate = _BITRATES[(min(version, 2), layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        samples, length = 384, (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 3 and version != 1:
+        samples, length = 576, 72 * bitrate // sample_rate + padding
+    else:
+        samples, length = 1152, 144 * bitrate // sample_rate + padding
+    return length, samples, sample_rate, version, b3 >> 6, layer
+
+
+def _vbr_header_trim(frame, version, mode):
+    """For a first frame carrying a Xing/Info or VBRI header: LAME delay + padding in samples.
+
+    Returns None when the frame is ordinary audio.
+    """
+    if version == 1:
+        offset = 36 if mode != _MONO else 21
+    else:
+        offset = 21 if mode != _MONO else 13
+    tag = frame[offset:offset + 4]
+    if tag not in (b"Xing", b"Info"):
+        return 0 if frame[36:40] == b"VBRI" else None
+
+    flags = int.from_bytes(frame[offset + 4:offset + 8], "big")
+    pos = offset + 8 + 4 * bool(flags & 1) + 4 * bool(flags & 2) + 100 * bool(flags & 4) + 4 * bool(flags & 8)
+    match = _LAME_VERSION.match(bytes(frame[pos:pos + 20]))
+    payload = frame[pos + 9:pos + 36]
+    if not match or (int(match[1]), int(match[2])) < (3, 90) or len(payload) < 15 or payload[0] >> 4 != 0:
+        return 0
+    delay = (payload[12] << 4) | (payload[13] >> 4)
+    padding = ((payload[13] & 0x0F) << 8) | payload[14]
+    return delay + padding
+
+
+class Mp3Stream:
+    """Incremental MD5 + MPEG frame count over bytes fed with `update`."""
+
+    def __init__(self):
+        self._md5 = hashlib.md5()
+        self._buf = bytearray()
+        self._skip = 0
+        self._at_start = True
+        self._synced = False
+        self._first_frame = True
+        self._samples = {}  # sample rate -> samples, in case a file switches rates mid-stream
+        self._trim = 0
+        self._trim_rate = None
+        self.frames = 0
+
+    def update(self, chunk):
+        self._md5.update(chunk)
+        if self._skip >= len(chunk):
+            self._skip -= len(chunk)
+            return
+        self._buf += memoryview(chunk)[self._skip:]
+        self._skip = 0
+        self._scan(final=False)
+
+    def hexdigest(self):
+        return self._md5.hexdigest()
+
+    def duration(self):
+        """Audio length in seconds after all bytes were fed, or None if no MPEG frame was found."""
+        self._scan(final=True)
+        if not self._samples:
+            return None
+        seconds = sum(samples / rate for rate, samples in self._samples.items())
+        if self._trim_rate:
+            seconds -= self._trim / self._trim_rate
+        return max(seconds, 0.0)
+
+    def _scan(self, final):
+        buf, i, end = self._buf, 0, len(self._buf)
+        while True:
+            if self._at_start:
+                if end - i < 10:
+                    if not final:
+                        break
+                    self._at_start = False
+                    continue
+                if buf[i:i + 3] != b"ID3":
+                    self._at_start = False
+                    continue
+                # Tag size is a 28-bit syncsafe integer; bit 4 of the flags adds a 10-byte footer
+                size = (buf[i + 6] << 21) | (buf[i + 7] << 14) | (buf[i + 8] << 7) | buf[i + 9]
+                size += 20 if buf[i + 5] & 0x10 else 10
+                if i + size > end:
+                    self._skip, i = i + size - end, end
+                    break
+                i += size
+                continue
+
+            if end - i < 4:
+                break
+            header = parse_frame_header(buf, i)
+            if header is not None and not self._synced:
+                # Only (re)sync onto a header that is followed by another one
+                nxt = i + header[0]
+                if nxt + 4 > end:
+                    if not final:
+                        break
+                    if nxt != end:
+                        header = None
+                elif parse_frame_header(buf, nxt) is None:
+                    header = None
+            if header is None:
+                self._synced = False
+                found = buf.find(b"\xff", i + 1)
+                i = found if found != -1 else end
+                continue
+
+            length, samples, rate, version, mode, layer = header
+            if i + length > end:
+                break  # wait for the rest of the frame; a truncated last frame isn't counted
+            trim = _vbr_header_trim(buf[i:i + length], version, mode) if self._first_frame and layer == 3 else None
+            self._first_frame = False
+            self._synced = True
+            if trim is not None:
+                self._trim, self._trim_rate = trim, rate
+            else:
+                self.frames += 1
+                self._samples[rate] = self._samples.get(rate, 0) + samples
+            i += length
+        del buf[:i]
+
+
+@contextmanager
+def open_replacing(dest_path):
+    """Write to a temporary file that replaces `dest_path` once the block succeeds.
+
+    Outputs are never rewritten in place: `dest_path` may be a hardlink shared
+    with another song's audio (build_cache), which would be overwritten too.
+    """
+    tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        with open(tmp_path, 'wb') as f:
+            yield f
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def copy_and_scan(src, dest_path, buffer_size=COPY_BUFFER_SIZE):
+    """Copy file object `src` to `dest_path` and return (md5 hex digest, duration in seconds or None)."""
+    stream = Mp3Stream()
+    with open_replacing(dest_path) as dst:
+        while True:
+            chunk = src.read(buffer_size)
+            if not chunk:
+                break
+            stream.update(chunk)
+            dst.write(chunk)
+    return stream.hexdigest(), stream.duration()
+
+
+def scan_file(path, buffer_size=COPY_BUFFER_SIZE):
+    """(md5 hex digest, duration in seconds or None) of an MP3 on disk."""
+    stream = Mp3Stream()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(buffer_size)
+            if not chunk:
+                break
+            stream.update(chunk)
+    return stream.hexdigest(), stream.duration()
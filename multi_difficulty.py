@@ -0,0 +1,73 @@
+"""Compare the timing of every difficulty in a beatmap set.
+
+Difficulties of one set are often timed independently, so their red lines
+can disagree. `group_difficulties` buckets the parsed difficulties by
+`osu_parser.timing_hash` (identical red lines, SV changes ignored) and orders
+the buckets by how many difficulties share them: the first bucket is the
+consensus timing, ties going to the difficulty that comes first in the archive
+(which is what the single-difficulty scripts use).
+
+`timing_agreement` scores each bucket's beat grid against the consensus grid
+with a nearest-neighbour F-measure (70 ms window, as in the evaluation), for
+beats and for downbeats separately.
+"""
+import numpy as np
+from osu_parser import timing_hash, uninherited_points
+
+AGREEMENT_WINDOW = 0.07  # seconds
+
+
+def group_difficulties(difficulties):
+    """[(osu_file, beatmap)] → groups of identical timing, consensus first.
+
+    Each group is {"hash", "osu_files", "versions", "beatmap", "num_red_lines"};
+    "beatmap" is the first member's.
+    """
+    groups = {}
+    for osu_file, beatmap in difficulties:
+        key = timing_hash(beatmap["timing_points"])
+        if key not in groups:
+            groups[key] = {"hash": key, "osu_files": [], "versions": [], "beatmap": beatmap,
+                           "num_red_lines": len(uninherited_points(beatmap["timing_points"]))}
+        groups[key]["osu_files"].append(osu_file)
+        groups[key]["versions"].append(beatmap["metadata"].get("Version", ""))
+    # dicts keep insertion order, and sorted is stable, so ties keep archive order
+    return sorted(groups.values(), key=lambda group: -len(group["osu_files"]))
+
+
+def beat_agreement(reference, estimate, window=AGREEMENT_WINDOW):
+    """F-measure of two sorted beat-time arrays, matching each beat to the nearest one in the other."""
+    if len(reference) == 0 or len(estimate) == 0:
+        return float(len(reference) == len(estimate))
+    precision = np.mean(nearest_distance(reference, estimate) <= window)
+    recall = np.mean(nearest_distance(estimate, reference) <= window)
+    if precision + recall == 0:
+        return 0.0
+    return float(2 * precision * recall / (precision + recall))
+
+
+def nearest_distance(reference, values):
+    """Distance from each of `values` to its nearest neighbour in sorted `reference`."""
+    if len(reference) == 1:
+        return np.abs(values - reference[0])
+    right = np.clip(np.searchsorted(reference, values), 1, len(reference) - 1)
+    left = right - 1
+    return np.minimum(np.abs(values - reference[left]), np.abs(values - reference[right]))
+
+
+def timing_agreement(grids, window=AGREEMENT_WINDOW):
+    """[(beat_times, beat_positions)] → [(beat_f, downbeat_f)] of each grid against grids[0]."""
+    ref_times, ref_positions = grids[0]
+    ref_downbeats = ref_times[ref_positions == 1]
+    return [(beat_agreement(ref_times, times, window),
+             beat_agreement(ref_downbeats, times[positions == 1], window))
+            for times, positions in grids]
+
+
+def difficulty_report(song_name, groups, agreement):
+    """One row per difficulty: its group (0 = consensus) and that group's agreement with the consensus."""
+    return [{"song_name": song_name, "osu_file": osu_file, "version": version, "timing_hash": group["hash"],
+             "group": index, "num_red_lines": group["num_red_lines"],
+             "beat_agreement": beat_f, "downbeat_agreement": downbeat_f}
+            for index, (group, (beat_f, downbeat_f)) in enumerate(zip(groups, agreement))
+            for osu_file, version in zip(group["osu_files"], group["versions"])]
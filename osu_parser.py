@@ -0,0 +1,77 @@
+"""Single-pass .osu parser shared by the conversion, partition and info scripts.
+
+Only [General], [Metadata] and [TimingPoints] are read; parsing stops at the
+first section header after all three have been consumed, so the (usually far
+larger) [HitObjects] section is never scanned.
+"""
+import hashlib
+import numpy as np
+from numpy.lib.recfunctions import repack_fields
+
+TIMING_POINT_DTYPE = np.dtype([
+    ("time", "f8"),          # ms from the start of the audio
+    ("beat_length", "f8"),   # ms per beat (uninherited) or negative SV multiplier (inherited)
+    ("meter", "i4"),         # beats per bar
+    ("uninherited", "?"),    # True for red lines
+])
+
+_KEY_VALUE_SECTIONS = ("[General]", "[Metadata]")
+_WANTED_SECTIONS = frozenset(_KEY_VALUE_SECTIONS + ("[TimingPoints]",))
+
+
+def parse_osu(lines):
+    """Parse an iterable of .osu lines into general/metadata dicts and a timing-point array.
+
+    Timing points with fewer than 7 fields or malformed numbers are skipped.
+    """
+    sections = {name: {} for name in _KEY_VALUE_SECTIONS}
+    timing_rows = []
+    seen = set()
+    section = None
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("//"):
+            continue
+        if line.startswith("["):
+            if seen == _WANTED_SECTIONS:
+                break
+            section = line
+            if section in _WANTED_SECTIONS:
+                seen.add(section)
+            continue
+
+        if section in sections:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                sections[section][key.strip()] = value.strip()
+        elif section == "[TimingPoints]":
+            parts = line.split(",")
+            if len(parts) >= 7:
+                try:
+                    timing_rows.append((float(parts[0]), float(parts[1]), int(parts[2]), int(parts[6]) == 1))
+                except ValueError:
+                    continue
+
+    return {
+        "general": sections["[General]"],
+        "metadata": sections["[Metadata]"],
+        "timing_points": np.array(timing_rows, dtype=TIMING_POINT_DTYPE),
+    }
+
+
+def parse_osu_file(osu_path):
+    with open(osu_path, 'r', encoding='utf-8') as f:
+        return parse_osu(f)
+
+
+def uninherited_points(timing_points):
+    """Red lines only, sorted by time (ties broken by beat length, then meter)."""
+    red = timing_points[timing_points["uninherited"]]
+    return np.sort(red, order=["time", "beat_length", "meter"])
+
+
+def timing_hash(timing_points):
+    """Digest of the red lines only, so difficulties that differ just in SV (green lines) hash equal."""
+    red = uninherited_points(timing_points)
+    return hashlib.sha1(repack_fields(red[["time", "beat_length", "meter"]]).tobytes()).hexdigest()
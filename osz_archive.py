@@ -0,0 +1,90 @@
+"""Read the members a beatmap needs straight out of an .osz, without extracting it.
+
+An .osz is a plain zip holding one or more .osu difficulties, the song MP3 and
+a pile of assets (backgrounds, videos, hitsounds, skins) none of the scripts use.
+`OszArchive` opens only the .osu and MP3 members through `ZipFile.open`.
+"""
+import hashlib
+import io
+import os
+import zipfile
+from mp3_stream import COPY_BUFFER_SIZE, Mp3Stream, copy_and_scan, open_replacing
+from osu_parser import parse_osu
+
+
+class OszArchive:
+    def __init__(self, osz_path):
+        self.path = osz_path
+        self.song_name = os.path.splitext(os.path.basename(osz_path))[0]
+        self._zip = zipfile.ZipFile(osz_path, 'r')
+        self._members = {name.lower(): name for name in self._zip.namelist()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    def osu_names(self):
+        """Names of all .osu difficulties in the archive, in archive order."""
+        return [name for name in self._zip.namelist() if name.endswith(".osu")]
+
+    def read_osu_lines(self, name):
+        with self._zip.open(name) as raw:
+            return io.TextIOWrapper(raw, encoding='utf-8').readlines()
+
+    def parse_osu(self, name):
+        """Parse a difficulty while streaming it; decompression stops before [HitObjects]."""
+        with self._zip.open(name) as raw:
+            return parse_osu(io.TextIOWrapper(raw, encoding='utf-8'))
+
+    def parse_all_osu(self):
+        """[(name, beatmap)] for every difficulty, parsed on this one open archive."""
+        return [(name, self.parse_osu(name)) for name in self.osu_names()]
+
+    def find_member(self, filename):
+        """Resolve an AudioFilename to a member name, falling back to a case-insensitive match."""
+        if filename in self._zip.NameToInfo:
+            return filename
+        return self._members.get(filename.lower())
+
+    def getinfo(self, name):
+        return self._zip.getinfo(name)
+
+    def copy_member(self, name, dest_path, buffer_size=COPY_BUFFER_SIZE):
+        """Stream a member into `dest_path` (replaced, never written in place) and return its MD5 hex digest."""
+        md5 = hashlib.md5()
+        with self._zip.open(name) as src, open_replacing(dest_path) as dst:
+            while True:
+                chunk = src.read(buffer_size)
+                if not chunk:
+                    break
+                md5.update(chunk)
+                dst.write(chunk)
+        return md5.hexdigest()
+
+    def copy_mp3(self, name, dest_path, buffer_size=COPY_BUFFER_SIZE):
+        """copy_member that also counts MPEG frames: returns (md5 hex digest, duration in seconds or None)."""
+        with self._zip.open(name) as src:
+            return copy_and_scan(src, dest_path, buffer_size)
+
+    def mp3_duration(self, name):
+        """Duration of an MP3 member in seconds, or None if it holds no MPEG frames.
+
+        mutagen only reads the headers; when it can't sync (HeaderNotFoundError)
+        the member is scanned frame by frame with mp3_stream instead.
+        """
+        from mutagen.mp3 import MP3, HeaderNotFoundError
+        with self._zip.open(name) as f:
+            try:
+                return MP3(f).info.length
+            except HeaderNotFoundError:
+                pass
+        stream = Mp3Stream()
+        with self._zip.open(name) as f:
+            for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b""):
+                stream.update(chunk)
+        return stream.duration()
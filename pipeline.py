@@ -0,0 +1,209 @@
+"""Single-pass dataset build: each .osz is opened once for every requested output.
+
+data_partition.py, data_conversion.py, song_info_csv.py and
+extract_uninherited_timing_points.py each open every archive on their own.
+run_pipeline chains generator stages instead,
+
+    read_archives → parse_beatmaps → classify → emit_outputs
+
+so every beatmap flows through all stages before the next archive is opened,
+and writes any combination of audio, metered beats, uninherited-timing JSON,
+the song-info CSV and the partition classification index. Each stage's own
+time (excluding upstream stages) is reported at the end.
+"""
+import json
+import os
+import time
+from additional_tools.extract_uninherited_timing_points import extract_uninherited_timing_points
+from additional_tools.song_info_csv import (add_song_info, get_mp3_duration_safe, song_info_record, song_info_writer,
+                                            summarize_beatmap)
+from data_conversion import extract_metered_beats_correct, write_metered_beats
+from data_partition import classification_index_row, classify_timing_points, save_classification_index
+from osz_archive import OszArchive
+from osu_parser import uninherited_points
+
+ALL_OUTPUTS = ("audio", "annotation", "timing_json", "song_info", "partition")
+
+
+class StageTimer:
+    """Inclusive wall time per stage; a stage's own time is its total minus its upstream's."""
+
+    def __init__(self):
+        self.inclusive = {}
+
+    def wrap(self, name, items):
+        # Registered eagerly so exclusive() sees stages in pipeline order.
+        self.inclusive[name] = 0.0
+        return self._timed(name, iter(items))
+
+    def _timed(self, name, iterator):
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.inclusive[name] += time.perf_counter() - started
+                return
+            self.inclusive[name] += time.perf_counter() - started
+            yield item
+
+    def exclusive(self):
+        result, upstream = {}, 0.0
+        for name, total in self.inclusive.items():
+            result[name] = total - upstream
+            upstream = total
+        return result
+
+
+# ===== Stages =====
+# Items are dicts; a stage that fails sets item["error"] and later stages pass it through.
+
+def read_archives(osz_paths):
+    """Open each archive; it stays open until the downstream stages are done with it."""
+    for osz_path in osz_paths:
+        item = {"osz_path": osz_path, "song_name": os.path.splitext(os.path.basename(osz_path))[0]}
+        try:
+            archive = OszArchive(osz_path)
+        except Exception as e:
+            item["error"] = f"Error opening {os.path.basename(osz_path)}: {e}"
+            yield item
+            continue
+        with archive:
+            item["archive"] = archive
+            yield item
+
+
+def parse_beatmaps(items):
+    """Parse the first difficulty, locate its MP3 and read the audio duration (None if unreadable)."""
+    for item in items:
+        if "error" not in item:
+            try:
+                archive = item["archive"]
+                osu_files = archive.osu_names()
+                if not osu_files:
+                    item["error"] = f"No .osu file found in {item['song_name']}"
+                else:
+                    item["beatmap"] = beatmap = archive.parse_osu(osu_files[0])
+                    audio_filename = beatmap["general"].get("AudioFilename")
+                    item["mp3_member"] = archive.find_member(audio_filename) if audio_filename else None
+                    item["duration"] = get_mp3_duration_safe(archive, item["mp3_member"]) if item["mp3_member"] else None
+            except Exception as e:
+                item["error"] = f"Error parsing {item['song_name']}: {e}"
+        yield item
+
+
+def classify(items, min_separation=5000):
+    for item in items:
+        if "error" not in item:
+            red_times = uninherited_points(item["beatmap"]["timing_points"])["time"].tolist()
+            item["category"] = classify_timing_points(red_times, min_separation)
+        yield item
+
+
+def emit_outputs(items, output_folder, outputs):
+    """Write the per-song files and attach the rows for the folder-level tables."""
+    for item in items:
+        if "error" not in item:
+            try:
+                _emit(item, output_folder, outputs)
+            except Exception as e:
+                item["error"] = f"Error writing {item['song_name']}: {e}"
+        yield item
+
+
+def _emit(item, output_folder, outputs):
+    song_name, beatmap = item["song_name"], item["beatmap"]
+
+    # Table rows first: like song_info_csv.py and data_partition.py, a missing or
+    # unreadable MP3 only leaves the duration empty
+    if "song_info" in outputs:
+        item["song_info"] = song_info_record(summarize_beatmap(beatmap), item["duration"], song_name)
+
+    if "partition" in outputs:
+        item["index_row"] = classification_index_row(os.path.basename(item["osz_path"]),
+                                                     beatmap["timing_points"], item["duration"])
+
+    needs_audio = "audio" in outputs or "annotation" in outputs
+    if needs_audio and item["mp3_member"] is None:
+        item["error"] = f"Expected mp3 file not found in {song_name}"
+        return
+    if "annotation" in outputs and not item["duration"]:
+        item["error"] = f"Unable to read duration of the mp3 in {song_name}"
+        return
+
+    if "audio" in outputs:
+        audio_folder = os.path.join(output_folder, 'new_audio')
+        os.makedirs(audio_folder, exist_ok=True)
+        item["archive"].copy_member(item["mp3_member"], os.path.join(audio_folder, f"{song_name}.mp3"))
+
+    if "annotation" in outputs:
+        annotation_folder = os.path.join(output_folder, 'metered_beats')
+        os.makedirs(annotation_folder, exist_ok=True)
+        beat_times, beat_positions = extract_metered_beats_correct(beatmap["timing_points"], item["duration"] * 1000)
+        write_metered_beats(os.path.join(annotation_folder, f"{song_name}_beats_metered.txt"),
+                            beat_times, beat_positions)
+
+    if "timing_json" in outputs:
+        json_folder = os.path.join(output_folder, 'uninherited_timing_json')
+        os.makedirs(json_folder, exist_ok=True)
+        with open(os.path.join(json_folder, f"{song_name}_uninherited.json"), 'w') as f:
+            json.dump(extract_uninherited_timing_points(beatmap["timing_points"]), f, indent=2)
+
+
+def run_pipeline(osz_folder, output_folder=None, outputs=ALL_OUTPUTS, min_separation=5000, verbose=True,
+                 song_info_path=None):
+    """Build every requested output for all .osz in `osz_folder` in a single pass.
+
+    Per-song outputs go to new_audio/, metered_beats/ and uninherited_timing_json/
+    under `output_folder` (default: `osz_folder`). Song-info rows are streamed to
+    `song_info_path` (default song_info.csv there; a .parquet path writes Parquet)
+    and classification_index.npz (see data_partition.classify_index) is written
+    at the end. Returns a summary with the per-stage timings.
+    """
+    output_folder = output_folder or osz_folder
+    song_info_path = song_info_path or os.path.join(output_folder, "song_info.csv")
+    unknown = set(outputs) - set(ALL_OUTPUTS)
+    if unknown:
+        raise ValueError(f"Unknown outputs: {sorted(unknown)}")
+
+    osz_paths = [os.path.join(osz_folder, f) for f in sorted(os.listdir(osz_folder)) if f.endswith('.osz')]
+
+    timer = StageTimer()
+    items = timer.wrap("read", read_archives(osz_paths))
+    items = timer.wrap("parse", parse_beatmaps(items))
+    items = timer.wrap("classify", classify(items, min_separation))
+    items = timer.wrap("emit", emit_outputs(items, output_folder, outputs))
+
+    summary = {"total": 0, "succeeded": [], "failed": {}, "categories": {}}
+    song_info = song_info_writer(song_info_path) if "song_info" in outputs else None
+    index_rows = []
+    for item in items:
+        summary["total"] += 1
+        if "song_info" in item:  # written even when the song's audio failed
+            add_song_info(song_info, item["song_info"])
+        if "index_row" in item:
+            index_rows.append(item["index_row"])
+        if "error" in item:
+            summary["failed"][item["song_name"]] = item["error"]
+            if verbose:
+                print(f"❌ {item['error']}")
+            continue
+        summary["succeeded"].append(item["song_name"])
+        summary["categories"][item["song_name"]] = item["category"]
+        if verbose:
+            print(f"✅ {item['song_name']} → {item['category']}")
+
+    started = time.perf_counter()
+    if song_info is not None:
+        song_info.close()
+    if "partition" in outputs:
+        save_classification_index(os.path.join(output_folder, "classification_index.npz"), osz_folder, index_rows)
+    summary["stage_seconds"] = {**timer.exclusive(), "tables": time.perf_counter() - started}
+
+    print(f"🎵 Built {len(summary['succeeded'])}/{summary['total']} beatmaps ({len(summary['failed'])} failed)")
+    print("⏱️ " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in summary["stage_seconds"].items()))
+    return summary
+
+
+if __name__ == "__main__":
+    run_pipeline("./osz_folder")
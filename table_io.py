@@ -0,0 +1,184 @@
+"""Row-streaming table output (.csv or .parquet) and typed loading of the tables/ results.
+
+`TableWriter` takes dict rows one at a time and flushes them in bounded
+batches, so the song-info table is never held in memory as a whole. Parquet
+output stores numeric columns with real types and dictionary-encodes
+low-cardinality text columns (artist, creator), which makes reloading and
+joining the info tables with the f_cmlt_amlt results cheap.
+
+pyarrow is only needed for .parquet files; CSV works without it. pyarrow and
+pandas are imported on first use, so writing CSV never pays for either.
+"""
+import csv
+import glob
+import math
+import os
+
+pa = pa_csv = pq = None  # pyarrow modules, set by _load_pyarrow()
+
+# Column types used when a table is written as (or converted to) Parquet
+INFO_TYPES = {
+    "title": "string", "artist": "string", "creator": "string", "tags": "string",
+    "num_timing_points": "int32", "num_uninherited_points": "int32",
+    "mp3_duration_seconds": "float64", "song_name": "string", "variation_rating_uninherited": "float64",
+}
+INFO_DICTIONARY_COLUMNS = ("artist", "creator")
+METRIC_COLUMNS = ("beat_fmeasure", "beat_cmlt", "beat_amlt", "downbeat_fmeasure", "downbeat_cmlt", "downbeat_amlt")
+RESULT_TYPES = {"song_id": "string", **{name: "float64" for name in METRIC_COLUMNS}}
+METRIC_LEVEL_TYPES = {"song_id": "string", "metric_level": "string",
+                      **{f"fmeasure_{level}": "float64"
+                         for level in ("annotated", "double", "half", "offbeat", "triple", "third")}}
+ALIGNMENT_TYPES = {"song_id": "string", "num_beats": "int32", "score": "float64", "offset_correction_ms": "float64",
+                   "best_score": "float64", "drift_ms": "float64", "flagged": "bool"}
+
+
+def _load_pyarrow():
+    """Import pyarrow on first use; False when it is not installed."""
+    global pa, pa_csv, pq
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.csv
+            import pyarrow.parquet
+        except ImportError:
+            return False
+        pa, pa_csv, pq = pyarrow, pyarrow.csv, pyarrow.parquet
+    return True
+
+
+def _require_pyarrow():
+    if not _load_pyarrow():
+        raise ImportError("Parquet output needs pyarrow (pip install pyarrow); use a .csv path instead")
+
+
+def _arrow_schema(columns, types, dictionary):
+    fields = []
+    for name in columns:
+        arrow_type = pa.type_for_alias(types.get(name, "string"))
+        if name in dictionary:
+            arrow_type = pa.dictionary(pa.int32(), arrow_type)
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+class TableWriter:
+    """Stream dict rows into `path`; the format follows the extension (.csv or .parquet).
+
+    Rows are buffered `batch_size` at a time. Missing values (None/NaN) are
+    written as empty CSV fields or Parquet nulls. The file is only created once
+    the first row arrives.
+    """
+
+    def __init__(self, path, columns, types=None, dictionary=(), batch_size=4096):
+        self.path = path
+        self.columns = list(columns)
+        self.rows = 0
+        self._parquet = path.endswith(".parquet")
+        self._types = types or {}
+        self._dictionary = tuple(dictionary)
+        self._batch_size = batch_size
+        self._batch = []
+        self._file = self._writer = None
+        if self._parquet:
+            _require_pyarrow()
+            self._schema = _arrow_schema(self.columns, self._types, self._dictionary)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, row):
+        self._batch.append(row)
+        self.rows += 1
+        if len(self._batch) >= self._batch_size:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        if self._writer is not None and self._parquet:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = self._writer = None
+
+    def _flush(self):
+        if not self._batch:
+            return
+        if self._parquet:
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            self._writer.write_batch(self._to_record_batch(self._batch))
+        else:
+            if self._writer is None:
+                self._file = open(self.path, 'w', newline='', encoding='utf-8')
+                self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+                self._writer.writeheader()
+            self._writer.writerows({name: _csv_value(row.get(name)) for name in self.columns} for row in self._batch)
+        self._batch = []
+
+    def _to_record_batch(self, rows):
+        arrays = []
+        for field in self._schema:
+            values = [_null_if_nan(row.get(field.name)) for row in rows]
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, type=field.type.value_type).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self._schema)
+
+
+def _null_if_nan(value):
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+def _csv_value(value):
+    value = _null_if_nan(value)
+    return "" if value is None else value
+
+
+def csv_to_parquet(csv_path, parquet_path=None, types=None, dictionary=()):
+    """Convert a results/info CSV to Parquet with typed and dictionary-encoded columns."""
+    _require_pyarrow()
+    parquet_path = parquet_path or os.path.splitext(csv_path)[0] + ".parquet"
+    types = types or {}
+    convert = pa_csv.ConvertOptions(column_types={name: pa.type_for_alias(t) for name, t in types.items()})
+    table = pa_csv.read_csv(csv_path, convert_options=convert)
+    for name in dictionary:
+        if name in table.column_names:
+            table = table.set_column(table.column_names.index(name), name,
+                                     table[name].cast(pa.string()).dictionary_encode())
+    pq.write_table(table, parquet_path)
+    return parquet_path
+
+
+def convert_tables(folder="tables"):
+    """Write a .parquet next to every *_info.csv, metric-level and f_cmlt_amlt/extreme result CSV in `folder`."""
+    written = []
+    for csv_path in sorted(glob.glob(os.path.join(folder, "*.csv"))):
+        if csv_path.endswith("_info.csv"):
+            written.append(csv_to_parquet(csv_path, types=INFO_TYPES, dictionary=INFO_DICTIONARY_COLUMNS))
+        elif csv_path.endswith("_metric_levels.csv"):
+            written.append(csv_to_parquet(csv_path, types=METRIC_LEVEL_TYPES, dictionary=("metric_level",)))
+        else:
+            written.append(csv_to_parquet(csv_path, types=RESULT_TYPES))
+    return written
+
+
+def read_table(path, columns=None):
+    """Load a table as a DataFrame, preferring a sibling .parquet over the .csv when one exists.
+
+    CSV fallbacks read song_name/song_id as strings so info and result tables join on them.
+    """
+    import pandas as pd
+    parquet_path = os.path.splitext(path)[0] + ".parquet"
+    if os.path.isfile(parquet_path) and _load_pyarrow():
+        return pd.read_parquet(parquet_path, columns=columns)
+    return pd.read_csv(path, usecols=columns, dtype={"song_name": str, "song_id": str})
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    for path in convert_tables("./tables"):
+        print(f"✅ Saved {path}")
@@ -0,0 +1,131 @@
+"""extract_metered_beats_correct must match the original per-beat loop.
+
+The reference below is the pre-vectorization implementation (`bt += beat_len`
+until the next red line), run on the same parsed timing points. Times are
+compared with np.allclose, counts and bar positions exactly.
+
+Set OSU2MIR_OSZ_FOLDER to a folder of the .osz files behind
+osu2beat2025_metered_beats.zip to also check the real maps, and the written
+annotations against the ones in the zip. Without it the comparison runs on
+synthetic maps only.
+"""
+import functools
+import hashlib
+import os
+import sys
+import zipfile
+import numpy as np
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from data_conversion import extract_metered_beats_correct
+from osu_parser import TIMING_POINT_DTYPE, parse_osu
+from osz_archive import OszArchive
+import synthetic_osz
+
+OSZ_FOLDER = os.environ.get("OSU2MIR_OSZ_FOLDER")
+ZIP_PATH = os.path.join(ROOT, "osu2beat2025_metered_beats.zip")
+TEXT_TOLERANCE = 1e-6  # annotations are written with 6 decimals
+
+
+def reference_metered_beats(timing_points, dur_ms):
+    """The original loop-based extract_metered_beats_correct, on a parsed timing-point array."""
+    beats_with_meter = []
+    red = sorted((float(t["time"]), float(t["beat_length"]), int(t["meter"]))
+                 for t in timing_points if t["uninherited"])
+    red.append((dur_ms, None, None))  # Dummy end
+    for i in range(len(red) - 1):
+        start_time, beat_len, meter = red[i]
+        end_time = red[i + 1][0]
+        beat_index = 1
+        bt = start_time
+        while bt < end_time:
+            if bt >= 0:
+                beats_with_meter.append((bt / 1000, beat_index))
+            beat_index = (beat_index % meter) + 1
+            bt += beat_len
+    return beats_with_meter
+
+
+def assert_same_grid(timing_points, dur_ms):
+    times, positions = extract_metered_beats_correct(timing_points, dur_ms)
+    expected = np.array(reference_metered_beats(timing_points, dur_ms), dtype=np.float64).reshape(-1, 2)
+    assert len(times) == len(expected)
+    assert np.allclose(times, expected[:, 0], rtol=0, atol=1e-9)
+    assert np.array_equal(positions, expected[:, 1].astype(positions.dtype))
+
+
+def random_timing_points(rng):
+    """Red lines with distinct times (some before 0 ms), meters 1-7, beat lengths 200-1500 ms, plus SV points."""
+    num_red = rng.integers(1, 12)
+    times = np.sort(rng.choice(np.arange(-2000, 300000, 7), size=num_red, replace=False)).astype(np.float64)
+    times += rng.uniform(0, 1, num_red).round(3)
+    rows = [(t, rng.uniform(200, 1500), int(rng.integers(1, 8)), True) for t in times]
+    rows += [(t, -rng.uniform(20, 200), 4, False) for t in rng.uniform(0, 300000, rng.integers(0, 20))]
+    return np.array(rows, dtype=TIMING_POINT_DTYPE)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_timing_points(seed):
+    rng = np.random.default_rng(seed)
+    timing_points = random_timing_points(rng)
+    assert_same_grid(timing_points, float(timing_points["time"].max() + rng.uniform(0, 60000)))
+
+
+@pytest.mark.parametrize("set_id", range(20))
+def test_synthetic_maps(set_id):
+    text = synthetic_osz.osu_text("audio.mp3", set_id, "Diff", length_s=60.0 + 10 * set_id,
+                                  num_timing_points=8 * (set_id + 1), offset_ms=-250.0 + 37.5 * set_id)
+    beatmap = parse_osu(text.splitlines())
+    assert_same_grid(beatmap["timing_points"], (60.0 + 10 * set_id) * 1000)
+
+
+def test_single_red_line_ends_at_audio_end():
+    timing_points = np.array([(120.0, 500.0, 4, True)], dtype=TIMING_POINT_DTYPE)
+    times, positions = extract_metered_beats_correct(timing_points, 2120.0)
+    assert np.allclose(times, [0.12, 0.62, 1.12, 1.62])
+    assert positions.tolist() == [1, 2, 3, 4]
+
+
+def _real_maps():
+    if not OSZ_FOLDER:
+        return []
+    return sorted(os.path.join(OSZ_FOLDER, name) for name in os.listdir(OSZ_FOLDER) if name.endswith(".osz"))
+
+
+@pytest.mark.skipif(not OSZ_FOLDER, reason="set OSU2MIR_OSZ_FOLDER to the .osz files behind the zip")
+@pytest.mark.parametrize("osz_path", _real_maps())
+def test_osu2beat2025_maps(osz_path):
+    with OszArchive(osz_path) as archive:
+        osu_files = archive.osu_names()
+        if not osu_files:
+            pytest.skip("no .osu in archive")
+        beatmap = archive.parse_osu(osu_files[0])
+        member = archive.find_member(beatmap["general"].get("AudioFilename", ""))
+        if member is None:
+            pytest.skip("audio missing from archive")
+        duration_s = archive.mp3_duration(member)
+    with zipfile.ZipFile(osz_path) as z, z.open(member) as f:
+        md5 = hashlib.md5(f.read()).hexdigest()
+    if duration_s is None:
+        pytest.skip("unreadable audio")
+    timing_points = beatmap["timing_points"]
+    assert_same_grid(timing_points, duration_s * 1000)
+
+    set_id = beatmap["metadata"].get("BeatmapSetID", "").strip()
+    annotations = _zip_annotations()
+    key = f"{md5}_{set_id}"
+    if key in annotations:
+        times, positions = extract_metered_beats_correct(timing_points, duration_s * 1000)
+        shipped = annotations[key]
+        assert len(times) == len(shipped)
+        assert np.allclose(times, shipped["time"], rtol=0, atol=TEXT_TOLERANCE)
+        assert np.array_equal(positions, shipped["position"])
+
+
+@functools.lru_cache(maxsize=None)
+def _zip_annotations():
+    from annotation_store import ZipAnnotations
+    return ZipAnnotations(ZIP_PATH) if os.path.isfile(ZIP_PATH) else {}
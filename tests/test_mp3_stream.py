@@ -0,0 +1,114 @@
+"""scan_file must agree with mutagen on duration and with hashlib on the MD5.
+
+Files are built from the synthetic CBR frames in benchmarks/synthetic_osz.
+mutagen estimates CBR files without a Xing header from their size, so those
+durations are compared within one frame; a Xing/LAME header gives both the
+exact sample count.
+"""
+import hashlib
+import io
+import os
+import sys
+import numpy as np
+import pytest
+
+mutagen_mp3 = pytest.importorskip("mutagen.mp3")
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from mp3_stream import copy_and_scan, scan_file
+import synthetic_osz
+
+FRAME_SECONDS = synthetic_osz.SAMPLES_PER_FRAME / synthetic_osz.SAMPLE_RATE
+ID3V2_SIZE = 266  # the empty tag in front of synthetic_osz.mp3_bytes
+ID3V1_TAG = b"TAG" + b"Title".ljust(30, b"\x00") + bytes(94) + b"\xff"
+
+
+def cbr_bytes(length_s, seed=0):
+    return synthetic_osz.mp3_bytes(length_s, np.random.default_rng(seed))
+
+
+def lame_info_frame(num_frames, audio_bytes, delay, padding):
+    """Silent first frame with an Info header and a LAME 3.100 tag carrying `delay` and `padding`."""
+    frame = bytearray(417)  # unpadded 128 kbit/s frame at 44.1 kHz
+    frame[:4] = synthetic_osz._FRAME_HEADER
+    info = b"Info" + (3).to_bytes(4, "big") + num_frames.to_bytes(4, "big") + audio_bytes.to_bytes(4, "big")
+    lame = bytearray(b"LAME3.100" + bytes(27))
+    lame[9 + 12:9 + 15] = bytes([delay >> 4, (delay & 0x0F) << 4 | padding >> 8, padding & 0xFF])
+    tag = info + lame
+    frame[36:36 + len(tag)] = tag
+    return bytes(frame)
+
+
+def write(tmp_path, data, name="audio.mp3"):
+    path = os.path.join(tmp_path, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def assert_matches(path, data, tolerance):
+    md5, duration = scan_file(path)
+    assert md5 == hashlib.md5(data).hexdigest()
+    assert duration == pytest.approx(mutagen_mp3.MP3(path).info.length, abs=tolerance)
+    return duration
+
+
+@pytest.mark.parametrize("length_s", [0.5, 3.0, 61.7])
+def test_cbr_frames(tmp_path, length_s):
+    data = cbr_bytes(length_s)
+    duration = assert_matches(write(tmp_path, data), data, FRAME_SECONDS)
+    num_frames = int(np.ceil(length_s / FRAME_SECONDS))
+    assert duration == pytest.approx(num_frames * FRAME_SECONDS)
+
+
+@pytest.mark.parametrize("delay, padding", [(576, 1152), (1105, 0), (0, 2000)])
+def test_xing_lame_header_trims_delay_and_padding(tmp_path, delay, padding):
+    audio = cbr_bytes(10.0)[ID3V2_SIZE:]
+    num_frames = int(np.ceil(10.0 / FRAME_SECONDS))
+    data = lame_info_frame(num_frames, 417 + len(audio), delay, padding) + audio
+    duration = assert_matches(write(tmp_path, data), data, 1e-9)
+    samples = num_frames * synthetic_osz.SAMPLES_PER_FRAME - delay - padding
+    assert duration == pytest.approx(samples / synthetic_osz.SAMPLE_RATE)
+
+
+def test_leading_junk(tmp_path):
+    audio = cbr_bytes(5.0)[ID3V2_SIZE:]
+    data = b"\x00junk\xff\xfe" * 40 + audio
+    assert_matches(write(tmp_path, data), data, FRAME_SECONDS)
+    assert scan_file(write(tmp_path, audio, "clean.mp3"))[1] == scan_file(write(tmp_path, data))[1]
+
+
+def test_trailing_id3v1_tag(tmp_path):
+    clean = cbr_bytes(5.0)
+    data = clean + ID3V1_TAG
+    assert_matches(write(tmp_path, data), data, FRAME_SECONDS)
+    assert scan_file(write(tmp_path, clean, "clean.mp3"))[1] == scan_file(write(tmp_path, data))[1]
+
+
+def test_truncated_last_frame_is_not_counted(tmp_path):
+    whole = cbr_bytes(5.0)
+    data = whole[:-200]
+    duration = assert_matches(write(tmp_path, data), data, FRAME_SECONDS)
+    assert duration == pytest.approx(scan_file(write(tmp_path, whole, "whole.mp3"))[1] - FRAME_SECONDS)
+
+
+def test_no_frames(tmp_path):
+    data = b"not an mp3" * 100
+    md5, duration = scan_file(write(tmp_path, data))
+    assert md5 == hashlib.md5(data).hexdigest()
+    assert duration is None
+
+
+@pytest.mark.parametrize("buffer_size", [1, 7, 418, 4096])
+def test_chunk_boundaries(tmp_path, buffer_size):
+    audio = cbr_bytes(2.0)[ID3V2_SIZE:]
+    num_frames = int(np.ceil(2.0 / FRAME_SECONDS))
+    data = b"junk" + lame_info_frame(num_frames, 417 + len(audio), 576, 1152) + audio + ID3V1_TAG
+    path = write(tmp_path, data)
+    assert scan_file(path, buffer_size=buffer_size) == scan_file(path)
+    dest = os.path.join(tmp_path, "copy.mp3")
+    assert copy_and_scan(io.BytesIO(data), dest, buffer_size=buffer_size) == scan_file(path)
+    with open(dest, 'rb') as f:
+        assert f.read() == data
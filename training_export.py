@@ -0,0 +1,295 @@
+"""Pack converted songs into fixed-size training shards with a byte-offset index.
+
+Reading tens of thousands of small audio and annotation files is dominated by
+file opens and stats, once per sample and per data-loader worker. The export
+packs each song's audio, metered beats and metadata into uncompressed tar
+shards of about `shard_bytes` (<split>-00000.tar, ...), grouped by sample key
+in WebDataset style:
+
+    <key>.mp3         the audio from new_audio/, byte for byte
+    <key>.beats.npy   (time, position) records, annotation_store.BEAT_DTYPE
+    <key>.json        song_name, beatmapset_id, md5, duration_seconds, split, subset
+                      and the song's row of the info table, if one is given
+
+index.npz next to the shards holds, per sample, its key, split, shard and the
+offset/size of each of the three members inside that shard, so any sample is
+one seek and three reads away (TrainingShards). Shards can also be read as
+plain sequential tar streams, one shard per worker.
+
+Splits are assigned per BeatmapSetID from a seeded hash, so every song of a
+beatmap set lands in the same split and re-exports (also of a grown corpus)
+keep existing sets where they were.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import tarfile
+import numpy as np
+from annotation_store import BEAT_DTYPE, load_text, open_annotations
+from data_conversion import MANIFEST_NAME
+from instrumentation import count, instrumented, stage
+import instrumentation
+
+INDEX_NAME = "index.npz"
+DEFAULT_SHARD_BYTES = 512 * 1024 ** 2
+DEFAULT_SPLITS = (("train", 0.8), ("val", 0.1), ("test", 0.1))
+MEMBERS = ("audio", "beats", "meta")
+_BLOCK = tarfile.BLOCKSIZE
+
+
+def assign_split(group, splits=DEFAULT_SPLITS, seed=0):
+    """Split name for a BeatmapSetID (or any group key), stable across runs and corpus sizes."""
+    digest = hashlib.sha1(f"{seed}:{group}".encode("utf-8")).digest()
+    fraction = int.from_bytes(digest[:8], "big") / 2 ** 64
+    total = sum(ratio for _, ratio in splits)
+    cumulative = 0.0
+    for name, ratio in splits:
+        cumulative += ratio / total
+        if fraction < cumulative:
+            return name
+    return splits[-1][0]
+
+
+def subsets_from_index(index_path, min_separation=5000):
+    """song_name → partition category, from a data_partition classification index."""
+    from data_partition import classify_index, load_classification_index
+    index = load_classification_index(index_path)
+    categories = classify_index(index, min_separation=min_separation)
+    return {os.path.splitext(name)[0]: str(category) for name, category in zip(index["filename"], categories)}
+
+
+def _order_key(seed, key):
+    return hashlib.sha1(f"{seed}:order:{key}".encode("utf-8")).digest()
+
+
+def read_manifest(folder):
+    with open(os.path.join(folder, MANIFEST_NAME), newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def _info_rows(info_path):
+    if info_path is None:
+        return {}
+    from table_io import read_table
+    table = read_table(info_path)
+    table = table.astype(object).where(table.notna(), None)
+    return {str(row["song_name"]): row for row in table.to_dict("records")}
+
+
+def _json_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class _ShardWriter:
+    """Tar shards of one split, started anew whenever the next sample would overflow `shard_bytes`."""
+
+    def __init__(self, folder, split, shard_bytes):
+        self.folder, self.split, self.shard_bytes = folder, split, shard_bytes
+        self.names = []
+        self._tar = self._tmp_path = None
+
+    def add(self, key, members):
+        """Write [(suffix, size, fileobj)] as one sample; returns [(offset, size)] of each member's data."""
+        sample_bytes = sum(_BLOCK + -(-size // _BLOCK) * _BLOCK for _, size, _ in members)
+        if self._tar is None or (self._tar.offset and self._tar.offset + sample_bytes > self.shard_bytes):
+            self._next_shard()
+        spans = []
+        for suffix, size, fileobj in members:
+            info = tarfile.TarInfo(key + suffix)
+            info.size, info.mode = size, 0o644  # mtime stays 0 so exports are reproducible
+            self._tar.addfile(info, fileobj)
+            spans.append((self._tar.offset - -(-size // _BLOCK) * _BLOCK, size))
+        return spans
+
+    def _next_shard(self):
+        self.close()
+        name = f"{self.split}-{len(self.names):05d}.tar"
+        self.names.append(name)
+        self._tmp_path = os.path.join(self.folder, f"{name}.{os.getpid()}.tmp")
+        self._tar = tarfile.open(self._tmp_path, 'w')
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+            os.replace(self._tmp_path, os.path.join(self.folder, self.names[-1]))
+            self._tar = None
+
+
+def export_shards(folder, output_folder, shard_bytes=DEFAULT_SHARD_BYTES, splits=DEFAULT_SPLITS, seed=0,
+                  subsets=None, info_path=None, label_store=None, stats_path=None):
+    """Export every song in `folder`'s manifest.csv (written by data_conversion) as training shards.
+
+    `subsets` maps song_name → subset label (see subsets_from_index), `info_path`
+    is a song_info_csv table whose rows are added to each sample's metadata, and
+    `label_store` (an annotation store or zip) supplies the beats of songs
+    converted with write_text=False. Returns the number of samples per split.
+    """
+    with instrumented("export", stats_path):
+        os.makedirs(output_folder, exist_ok=True)
+        subsets = subsets or {}
+        info = _info_rows(info_path)
+        store = open_annotations(label_store) if label_store else None
+
+        by_split = {name: [] for name, _ in splits}
+        for row in read_manifest(folder):
+            group = row["beatmapset_id"] or row["song_name"]
+            by_split[assign_split(group, splits, seed)].append(row)
+
+        index = {name: [] for name in ("keys", "splits", "shards", "beatmapset_id", "subset")}
+        index.update({f"{member}_{field}": [] for member in MEMBERS for field in ("offset", "size")})
+        shard_names = []
+        for split, rows in by_split.items():
+            rows.sort(key=lambda row: _order_key(seed, row["song_name"]))  # shuffled, but reproducibly
+            writer = _ShardWriter(output_folder, split, shard_bytes)
+            for row in rows:
+                key = os.path.splitext(os.path.basename(row["audio"]))[0]
+                with instrumentation.track_file(key):
+                    try:
+                        with stage("read"):
+                            beats = _load_beats(folder, row, key, store)
+                            meta = {"key": key, "song_name": row["song_name"], "beatmapset_id": row["beatmapset_id"],
+                                    "md5": row["md5"], "duration_seconds": float(row["duration_seconds"] or "nan"),
+                                    "split": split, "subset": subsets.get(row["song_name"], "")}
+                            meta.update((name, _json_value(value)) for name, value in info.get(row["song_name"], {}).items()
+                                        if name not in meta)
+                            beats_blob = io.BytesIO()
+                            np.save(beats_blob, beats)
+                            meta_blob = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+                        audio_path = os.path.join(folder, row["audio"])
+                        with stage("write"), open(audio_path, 'rb') as audio:
+                            spans = writer.add(key, [
+                                (os.path.splitext(audio_path)[1], os.fstat(audio.fileno()).st_size, audio),
+                                (".beats.npy", beats_blob.tell(), io.BytesIO(beats_blob.getvalue())),
+                                (".json", len(meta_blob), io.BytesIO(meta_blob)),
+                            ])
+                    except (OSError, KeyError, ValueError) as e:
+                        count("unreadable_sample")
+                        print(f"❌ Skipped {key}: {e}")
+                        continue
+                index["keys"].append(key)
+                index["splits"].append(split)
+                index["shards"].append(len(shard_names) + len(writer.names) - 1)
+                index["beatmapset_id"].append(row["beatmapset_id"])
+                index["subset"].append(meta["subset"])
+                for member, (offset, size) in zip(MEMBERS, spans):
+                    index[f"{member}_offset"].append(offset)
+                    index[f"{member}_size"].append(size)
+            writer.close()
+            shard_names.extend(writer.names)
+
+        with stage("write"):
+            _save_index(os.path.join(output_folder, INDEX_NAME), index, shard_names)
+        sizes = {split: index["splits"].count(split) for split in by_split}
+        print(f"✅ Exported {len(index['keys'])} songs into {len(shard_names)} shards in {output_folder} "
+              f"({', '.join(f'{split}: {n}' for split, n in sizes.items())})")
+        return sizes
+
+
+def _load_beats(folder, row, key, store):
+    if row["annotation"]:
+        return load_text(os.path.join(folder, row["annotation"]))
+    if store is None:
+        raise KeyError(f"no annotation for {key} (converted with write_text=False? pass label_store)")
+    return np.asarray(store[key], dtype=BEAT_DTYPE)
+
+
+def _save_index(index_path, index, shard_names):
+    arrays = {name: np.array(values, dtype=str) for name, values in index.items()
+              if name in ("keys", "splits", "beatmapset_id", "subset")}
+    arrays["shards"] = np.array(index["shards"], dtype=np.int32)
+    arrays.update({name: np.array(values, dtype=np.int64) for name, values in index.items()
+                   if name.endswith(("_offset", "_size"))})
+    arrays["shard_names"] = np.array(shard_names, dtype=str)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, index_path)  # written last: readers never see an index pointing at missing shards
+
+
+def _split_member(name):
+    """'<key>.beats.npy' → (key, '.beats.npy'); keys may contain dots themselves."""
+    for suffix in (".beats.npy", ".json"):
+        if name.endswith(suffix):
+            return name[:-len(suffix)], suffix
+    return os.path.splitext(name)
+
+
+def _decode_sample(key, audio, beats, meta):
+    return {"key": key, "audio": audio, "beats": np.load(io.BytesIO(beats)), "meta": json.loads(meta)}
+
+
+class TrainingShards:
+    """Random and sequential access to an export_shards folder, optionally restricted to one split.
+
+    Samples are dicts of key, audio (the encoded file's bytes), beats and meta.
+    Shard files are opened lazily and reopened per process, so instances can
+    be handed to data-loader workers.
+    """
+
+    def __init__(self, folder, split=None):
+        self.folder = folder
+        with np.load(os.path.join(folder, INDEX_NAME)) as index:
+            self.index = {name: index[name] for name in index.files}
+        self.shard_names = self.index.pop("shard_names").tolist()
+        if split is not None:
+            selected = self.index["splits"] == split
+            self.index = {name: values[selected] for name, values in self.index.items()}
+        self.keys = self.index["keys"].tolist()
+        self.shards = [self.shard_names[i] for i in np.unique(self.index["shards"])]
+        self._files, self._pid = {}, None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, i):
+        f = self._shard_file(int(self.index["shards"][i]))
+        blobs = []
+        for member in MEMBERS:
+            f.seek(int(self.index[f"{member}_offset"][i]))
+            blobs.append(f.read(int(self.index[f"{member}_size"][i])))
+        return _decode_sample(self.keys[i], *blobs)
+
+    def __iter__(self):
+        return self.iter_shards()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_files={}, _pid=None)
+        return state
+
+    def _shard_file(self, shard):
+        if self._pid != os.getpid():
+            self._files, self._pid = {}, os.getpid()
+        if shard not in self._files:
+            self._files[shard] = open(os.path.join(self.folder, self.shard_names[shard]), 'rb')
+        return self._files[shard]
+
+    def worker_shards(self, worker_id, num_workers):
+        """This worker's share of the split's shards, for one sequential stream per worker."""
+        return self.shards[worker_id::num_workers]
+
+    def iter_shards(self, shards=None):
+        """Stream samples shard by shard in file order, without using the offsets."""
+        for name in self.shards if shards is None else shards:
+            with tarfile.open(os.path.join(self.folder, name), 'r|') as tar:
+                key, blobs = None, {}
+                for info in tar:
+                    member_key, suffix = _split_member(info.name)
+                    if member_key != key and blobs:
+                        yield self._sample_from_stream(key, blobs)
+                        blobs = {}
+                    key = member_key
+                    blobs[suffix] = tar.extractfile(info).read()
+                if blobs:
+                    yield self._sample_from_stream(key, blobs)
+
+    @staticmethod
+    def _sample_from_stream(key, blobs):
+        audio = next(blob for suffix, blob in blobs.items() if suffix not in (".beats.npy", ".json"))
+        return _decode_sample(key, audio, blobs[".beats.npy"], blobs[".json"])
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    export_shards("./osz_folder", "./training_shards", info_path="./single_timing_song_info.csv")